@@ -0,0 +1,6 @@
+"""Benchmarks for the game internals. Run them from the repository root, e.g.:
+
+    python -m benchmarks.bench_snapshot
+    python -m benchmarks.macro
+    python -m benchmarks.micro
+"""
@@ -0,0 +1,29 @@
+"""Compare Engine.fork with deepcopy and a pickle round-trip on a populated floor."""
+from __future__ import annotations
+
+import copy
+import pickle
+
+from benchmarks.common import populated_engine, rate
+
+
+def main() -> None:
+    engine = populated_engine()
+    snapshot = engine.snapshot()
+    print(f"Floor with {len(engine.game_map.entities)} entities, {len(snapshot)} objects.")
+
+    results = {
+        "snapshot": lambda: engine.snapshot(),
+        "restore": lambda: snapshot.restore(),
+        "fork": lambda: engine.fork(),
+        "deepcopy": lambda: copy.deepcopy(engine),
+        "pickle": lambda: pickle.loads(pickle.dumps(engine)),
+    }
+    rates = {name: rate(function) for name, function in results.items()}
+    for name, clones in rates.items():
+        print(f"{name:>10}: {clones:10.0f} clones/sec")
+    print(f"fork is {rates['fork'] / rates['pickle']:.2f} times as fast as pickle.")
+
+
+if __name__ == "__main__":
+    main()
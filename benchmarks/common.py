@@ -0,0 +1,79 @@
+"""Helpers shared by the benchmarks."""
+from __future__ import annotations
+
+import copy
+import random
+import time
+from typing import Callable
+
+import numpy as np
+
+from resources import entity_factories
+from resources.engine import Engine
+from resources.game_map import GameWorld
+from resources import setup_game
+
+
+def populated_engine(actors: int = 40, items: int = 40, seed: int = 0) -> Engine:
+    """Return a new game whose first floor has extra monsters and items on free floor tiles."""
+    engine = setup_game.new_game(seed)
+    populate(engine, actors, items)
+    return engine
+
+
+def dungeon_engine(width: int, height: int, seed: int = 0) -> Engine:
+    """
+    Return a game whose first floor is a `width` x `height` dungeon.
+
+    The number of rooms grows with the area, so bigger maps are about as dense as the game's.
+    """
+    random.seed(seed)
+    engine = Engine(player=copy.deepcopy(entity_factories.player))
+    engine.game_world = GameWorld(
+        engine=engine,
+        map_width=width,
+        map_height=height,
+        max_rooms=rooms_for(width, height),
+        room_min_size=6,
+        room_max_size=10,
+    )
+    engine.game_world.generate_floor()
+    engine.update_fov()
+    return engine
+
+
+def rooms_for(width: int, height: int) -> int:
+    """The maximum number of rooms of a map, 30 for a map of the game's size (80x43)."""
+    return max(1, 30 * width * height // (80 * 43))
+
+
+def populate(engine: Engine, actors: int, items: int) -> None:
+    """Spawn monsters and items on free floor tiles of the current floor."""
+    game_map = engine.game_map
+
+    occupied = {(entity.x, entity.y) for entity in game_map.entities}
+    free = [
+        (int(x), int(y))
+        for x, y in np.argwhere(game_map.tiles["walkable"])
+        if (x, y) not in occupied
+    ]
+    random.shuffle(free)
+
+    prototypes = [entity_factories.orc, entity_factories.troll]
+    for x, y in free[:actors]:
+        random.choice(prototypes).spawn(game_map, x, y)
+    for x, y in free[actors : actors + items]:
+        entity_factories.health_potion.spawn(game_map, x, y)
+    engine.update_fov()
+
+
+def rate(function: Callable[[], object], seconds: float = 1.0) -> float:
+    """Call `function` repeatedly for about `seconds` and return the calls per second."""
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
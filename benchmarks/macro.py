@@ -0,0 +1,179 @@
+"""
+Replay the recorded games (see traces.py) and compare the results with a baseline recorded
+on the same machine.
+
+For each trace it measures the time of the whole replay and its turns per second (rendering
+every frame), the peak memory traced during a replay, and the time to save the final game and
+load it back. Times are the median of several runs. Timings only compare on one machine, so
+the baseline isn't part of the repository: the first run on a machine records it, and a
+baseline of another machine is recorded again instead of being compared with.
+
+    python -m benchmarks.macro                    # Compare with the baseline of this machine.
+    python -m benchmarks.macro --update-baseline  # Store these results as the baseline.
+
+Exits with 1 when a result is worse than the baseline by more than the threshold, or when a
+replay didn't play the same turns as recorded: the numbers then describe another game.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from benchmarks import traces
+from resources import headless
+from resources import setup_game
+
+# Ignored by git, each machine keeps its own.
+BASELINE_FILENAME = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Metric: True if higher is better.
+METRICS = {
+    "seconds": False,
+    "turns_per_second": True,
+    "peak_memory_kib": False,
+    "save_ms": False,
+    "load_ms": False,
+}
+
+# Saves and loads take a few milliseconds, each timed run does a batch of them.
+SAVE_LOAD_BATCH = 10
+
+
+def machine() -> str:
+    """Describe this machine, baselines are only compared on the machine they were recorded on."""
+    return " ".join((
+        platform.node(), platform.machine(), platform.processor(),
+        platform.python_implementation(), platform.python_version(),
+    ))
+
+
+def measure(all_traces: List[Dict[str, Any]], repeat: int) -> Dict[str, Dict[str, float]]:
+    """Return the results of each trace, by name."""
+    # The runs of the traces take turns, so a slow spell of the machine is shared by all of
+    # them instead of falling on a single trace.
+    times: Dict[str, Dict[str, List[float]]] = {
+        trace["name"]: {"seconds": [], "save": [], "load": []} for trace in all_traces
+    }
+    engines = {}
+    turns = {}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "benchmark.sav")
+        for _ in range(repeat):
+            for trace in all_traces:
+                name = trace["name"]
+                engine = engines[name] = traces.setup(trace)
+                start = time.perf_counter()
+                turns[name] = headless.replay(engine, trace["keys"])
+                times[name]["seconds"].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for _ in range(SAVE_LOAD_BATCH):
+                    engine.save_as(filename)
+                times[name]["save"].append((time.perf_counter() - start) / SAVE_LOAD_BATCH)
+                start = time.perf_counter()
+                for _ in range(SAVE_LOAD_BATCH):
+                    setup_game.load_game(filename)
+                times[name]["load"].append((time.perf_counter() - start) / SAVE_LOAD_BATCH)
+
+    results = {}
+    for trace in all_traces:
+        name = trace["name"]
+        # Traced separately, tracing makes everything slower. The garbage of the timed runs
+        # is collected first, so collections don't move the peak around.
+        gc.collect()
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        headless.replay(traces.setup(trace), trace["keys"])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        seconds = statistics.median(times[name]["seconds"])
+        results[name] = {
+            "turns": turns[name],
+            "seconds": seconds,
+            "turns_per_second": turns[name] / seconds,
+            "peak_memory_kib": peak / 1024,
+            "save_ms": statistics.median(times[name]["save"]) * 1000,
+            "load_ms": statistics.median(times[name]["load"]) * 1000,
+        }
+    return results
+
+
+def compare(
+        name: str, result: Dict[str, float], baseline: Dict[str, float], threshold: float,
+) -> List[str]:
+    """Print how `result` compares with `baseline`, and return its regressions."""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        change = result[metric] / baseline[metric] - 1 if baseline[metric] else 0.0
+        worse = -change if higher_is_better else change
+        flag = " REGRESSION" if worse > threshold else ""
+        print(
+            f"  {metric:>17}: {result[metric]:10.2f} (baseline {baseline[metric]:10.2f}, "
+            f"{change:+.0%}){flag}"
+        )
+        if flag:
+            regressions.append(f"{name}: {metric} is {worse:.0%} worse than the baseline.")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="How much worse than the baseline a result can be, 0.2 is 20%%.",
+    )
+    parser.add_argument("--repeat", type=int, default=9, help="Timed runs per trace.")
+    arguments = parser.parse_args()
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    if os.path.exists(BASELINE_FILENAME) and not arguments.update_baseline:
+        with open(BASELINE_FILENAME, "r", encoding="utf-8") as f:
+            recorded = json.load(f)
+        if recorded.get("machine") == machine():
+            baseline = recorded["traces"]
+        else:
+            print(f"{BASELINE_FILENAME} was recorded on another machine, recording it again.")
+
+    all_traces = traces.load_traces()
+    results = measure(all_traces, arguments.repeat)
+    regressions: List[str] = []
+    for trace in all_traces:
+        name = trace["name"]
+        result = results[name]
+        print(f"{name} ({result['turns']} turns): {trace['description']}")
+        if result["turns"] != trace["turns"]:
+            regressions.append(
+                f"{name}: played {result['turns']} turns instead of {trace['turns']}, "
+                f"record the traces again."
+            )
+        if name in baseline:
+            regressions += compare(name, result, baseline[name], arguments.threshold)
+        else:
+            for metric in METRICS:
+                print(f"  {metric:>17}: {result[metric]:10.2f}")
+
+    if arguments.update_baseline or not baseline:
+        if regressions:
+            print("The baseline isn't written, the replays don't match the traces.")
+        else:
+            with open(BASELINE_FILENAME, "w", encoding="utf-8") as f:
+                json.dump({"machine": machine(), "traces": results}, f, indent=2)
+            print(f"Baseline written to {BASELINE_FILENAME}.")
+    for regression in regressions:
+        print(regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Time the hot paths of the game one by one, over growing map sizes and entity counts.
+
+Each benchmark sweeps one parameter (the tiles of the map, the entities on it, the lines of
+the message log...) and prints the time per call for every value, followed by the scaling
+exponent: the slope of log(time) over log(parameter). About 0 means the cost doesn't depend
+on the parameter, 1 that it grows linearly, 2 quadratically.
+
+    python -m benchmarks.micro                  # Every benchmark.
+    python -m benchmarks.micro --quick          # Smaller sweeps, for a quick look.
+    python -m benchmarks.micro --only render    # Only the benchmarks whose name contains "render".
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import timeit
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import tcod
+
+from benchmarks.common import dungeon_engine, populate, rooms_for
+from resources import entity_factories
+from resources import procgen
+from resources import setup_game
+from resources.engine import Engine
+from resources.message_log import MessageLog
+
+# Map sizes, from the size of the game's map to 64 times its area.
+MAP_SIZES = [(80, 43), (160, 86), (320, 172), (640, 344)]
+# Entities added to a 320x172 map.
+ENTITY_COUNTS = [10, 100, 1000, 5000]
+ENTITY_MAP_SIZE = (320, 172)
+# Lines of the message log drawn, and messages in the log.
+LOG_LINES = [5, 20, 80]
+LOG_MESSAGES = [100, 1000, 10000]
+
+# A benchmark makes the function to time for a value of its parameter.
+Setup = Callable[[int], Callable[[], object]]
+
+
+class Benchmark:
+    """A hot path timed for each value of one parameter."""
+
+    def __init__(self, name: str, parameter: str, values: Sequence[int], setup: Setup):
+        self.name = name
+        self.parameter = parameter
+        self.values = values
+        self.setup = setup
+
+    def run(self, repeat: int) -> List[Tuple[int, float]]:
+        """Return the seconds per call for every value."""
+        return [(value, seconds_per_call(self.setup(value), repeat)) for value in self.values]
+
+
+def seconds_per_call(function: Callable[[], object], repeat: int) -> float:
+    """The best time of `function` over `repeat` runs of about 0.2 seconds each."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def scaling_exponent(results: List[Tuple[int, float]]) -> float:
+    """The slope of the line fitting log(seconds) over log(value)."""
+    values, seconds = zip(*results)
+    slope, _ = np.polyfit(np.log(values), np.log(seconds), 1)
+    return float(slope)
+
+
+def map_engine(tiles: int) -> Engine:
+    """The engine of the swept map size whose area is `tiles`."""
+    width, height = map_sizes[tiles]
+    return dungeon_engine(width, height)
+
+
+def entity_engine(entities: int) -> Engine:
+    """A 320x172 map holding about `entities` monsters and items besides the dungeon's own."""
+    engine = dungeon_engine(*ENTITY_MAP_SIZE)
+    random.seed(entities)
+    populate(engine, actors=entities // 2, items=entities - entities // 2)
+    return engine
+
+
+def reveal(engine: Engine) -> None:
+    """Make the whole map visible, so every tile and entity is drawn."""
+    engine.game_map.visible[:] = True
+    engine.game_map.explored[:] = True
+
+
+def far_orc(engine: Engine) -> Callable[[], object]:
+    """Time an orc finding its way to the player from the walkable tile farthest from them."""
+    game_map = engine.game_map
+    player = engine.player
+    walkable = np.argwhere(game_map.tiles["walkable"])
+    distances = np.abs(walkable - (player.x, player.y)).sum(axis=1)
+    x, y = (int(i) for i in walkable[distances.argmax()])
+    orc = entity_factories.orc.spawn(game_map, x, y)
+    return lambda: orc.ai.get_path_to(player.x, player.y)
+
+
+# Setups by parameter: "tiles" benchmarks get a map of each size, "entities" ones a crowded map.
+
+def generate_dungeon(tiles: int) -> Callable[[], object]:
+    engine = map_engine(tiles)
+    width, height = map_sizes[tiles]
+    return lambda: procgen.generate_dungeon(
+        max_rooms=rooms_for(width, height),
+        room_min_size=6,
+        room_max_size=10,
+        map_width=width,
+        map_height=height,
+        engine=engine,
+    )
+
+
+def render_map(engine: Engine) -> Callable[[], object]:
+    reveal(engine)
+    game_map = engine.game_map
+    # Maps bigger than the screen only draw the part around the player.
+    console = tcod.console.Console(80, 50, order="F")
+    return lambda: game_map.render(console)
+
+
+def blocking_entity(entities: int) -> Callable[[], object]:
+    # Nothing stands on (0, 0), a wall, so every entity is looked at.
+    game_map = entity_engine(entities).game_map
+    return lambda: game_map.get_blocking_entity_at_location(0, 0)
+
+
+def spawn(entities: int) -> Callable[[], object]:
+    game_map = entity_engine(entities).game_map
+    x, y = game_map.engine.player.x, game_map.engine.player.y
+
+    def spawn_and_remove() -> None:
+        # Removed again, so the map keeps the same number of entities.
+        game_map.entities.remove(entity_factories.orc.spawn(game_map, x, y))
+
+    return spawn_and_remove
+
+
+def message_log(lines: int, messages: int) -> Callable[[], object]:
+    log = MessageLog(capacity=messages)
+    for i in range(messages):
+        log.add_message(f"The Orc attacks the player for {i % 7} hit points.")
+    console = tcod.console.Console(80, lines, order="F")
+    # The first render wraps the messages, the next ones use the wrapped lines like every frame.
+    return lambda: log.render(console, 0, 0, 40, lines)
+
+
+def save(engine: Engine) -> Callable[[], object]:
+    filename = os.path.join(directory, f"micro{id(engine)}.sav")
+    return lambda: engine.save_as(filename)
+
+
+def load(engine: Engine) -> Callable[[], object]:
+    filename = os.path.join(directory, f"micro{id(engine)}.sav")
+    engine.save_as(filename)
+    return lambda: setup_game.load_game(filename)
+
+
+def benchmarks(sizes: Sequence[Tuple[int, int]], counts: Sequence[int]) -> List[Benchmark]:
+    tiles = [width * height for width, height in sizes]
+    return [
+        Benchmark("procgen.generate_dungeon", "tiles", tiles, generate_dungeon),
+        Benchmark("GameMap.render", "tiles", tiles, lambda n: render_map(map_engine(n))),
+        Benchmark("GameMap.render", "entities", counts, lambda n: render_map(entity_engine(n))),
+        Benchmark("Engine.update_fov", "tiles", tiles, lambda n: map_engine(n).update_fov),
+        Benchmark("BaseAI.get_path_to", "tiles", tiles, lambda n: far_orc(map_engine(n))),
+        Benchmark("BaseAI.get_path_to", "entities", counts, lambda n: far_orc(entity_engine(n))),
+        Benchmark(
+            "GameMap.get_blocking_entity_at_location", "entities", counts, blocking_entity
+        ),
+        Benchmark("Entity.spawn", "entities", counts, spawn),
+        Benchmark(
+            "MessageLog.render_messages", "lines", LOG_LINES,
+            lambda n: message_log(n, LOG_MESSAGES[0]),
+        ),
+        Benchmark(
+            "MessageLog.render_messages", "messages", LOG_MESSAGES,
+            lambda n: message_log(5, n),
+        ),
+        Benchmark("Engine.save_as", "tiles", tiles, lambda n: save(map_engine(n))),
+        Benchmark("Engine.save_as", "entities", counts, lambda n: save(entity_engine(n))),
+        Benchmark("setup_game.load_game", "tiles", tiles, lambda n: load(map_engine(n))),
+        Benchmark("setup_game.load_game", "entities", counts, lambda n: load(entity_engine(n))),
+    ]
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-6:8.2f} us"
+
+
+# Map sizes by area, for the setups which only get the area.
+map_sizes: Dict[int, Tuple[int, int]] = {}
+# Where the saves written by the benchmarks go.
+directory = ""
+
+
+def main() -> None:
+    global directory
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--quick", action="store_true", help="Skip the biggest sizes.")
+    parser.add_argument("--only", default="", help="Only run benchmarks whose name has this.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per value, the best counts.")
+    args = parser.parse_args()
+
+    sizes = MAP_SIZES[:-1] if args.quick else MAP_SIZES
+    counts = ENTITY_COUNTS[:-1] if args.quick else ENTITY_COUNTS
+    map_sizes.update({width * height: (width, height) for width, height in sizes})
+
+    with tempfile.TemporaryDirectory() as directory:
+        for benchmark in benchmarks(sizes, counts):
+            if args.only not in benchmark.name:
+                continue
+            results = benchmark.run(args.repeat)
+            print(f"{benchmark.name} by {benchmark.parameter}:")
+            for value, seconds in results:
+                print(f"  {value:>8} {benchmark.parameter:<8} {format_seconds(seconds)}")
+            print(f"  scaling exponent: {scaling_exponent(results):.2f}")
+
+
+if __name__ == "__main__":
+    main()
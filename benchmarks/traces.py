@@ -0,0 +1,88 @@
+"""
+Recorded games replayed by the macro benchmark.
+
+A trace is the setup of a game (its seed, the extra monsters and items on the first floor,
+see common.populated_engine, and the player's health) and the keys pressed during it. The keys were chosen by the
+headless bot, replaying them doesn't need the bot anymore. Record the traces again with:
+
+    python -m benchmarks.traces
+"""
+from __future__ import annotations
+
+import glob
+import json
+import os
+from typing import Any, Dict, List
+
+from benchmarks.common import populated_engine
+from resources.engine import Engine
+from resources import headless
+
+TRACE_DIRECTORY = os.path.join(os.path.dirname(__file__), "traces")
+
+# name: (description, setup and bot settings)
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "exploration": dict(
+        description="Explores most of each floor before going down.",
+        seed=1, actors=0, items=0, player_hp=500, explore=0.9, turns=3000,
+    ),
+    "combat": dict(
+        description="A first floor crowded with monsters.",
+        seed=2, actors=40, items=0, player_hp=2000, explore=0.0, turns=2000,
+    ),
+    "items": dict(
+        description="Picks up and drinks the potions spread over the first floor.",
+        seed=3, actors=4, items=60, player_hp=100, explore=0.5, turns=2000,
+    ),
+    "descent": dict(
+        description="Goes down as soon as it finds the stairs.",
+        seed=4, actors=0, items=0, player_hp=500, explore=0.0, turns=3000,
+    ),
+}
+
+
+def setup(trace: Dict[str, Any]) -> Engine:
+    """Return the game a trace starts from."""
+    engine = populated_engine(actors=trace["actors"], items=trace["items"], seed=trace["seed"])
+    # A sturdier player lives long enough for the trace to cover several floors or fights.
+    engine.player.fighter.max_hp = engine.player.fighter.hp = trace["player_hp"]
+    return engine
+
+
+def load_traces() -> List[Dict[str, Any]]:
+    traces = []
+    for filename in sorted(glob.glob(os.path.join(TRACE_DIRECTORY, "*.json"))):
+        with open(filename, "r", encoding="utf-8") as f:
+            traces.append(json.load(f))
+    return traces
+
+
+def record(name: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    trace = {
+        "name": name,
+        "description": settings["description"],
+        "seed": settings["seed"],
+        "actors": settings["actors"],
+        "items": settings["items"],
+        "player_hp": settings["player_hp"],
+    }
+    engine = setup(trace)
+    keys: List[int] = []
+    bot = headless.Bot(settings["seed"], explore=settings["explore"])
+    turns = headless.play(engine, settings["turns"], render=False, bot=bot, record=keys)
+    trace["turns"] = turns
+    trace["keys"] = keys
+    return trace
+
+
+def main() -> None:
+    os.makedirs(TRACE_DIRECTORY, exist_ok=True)
+    for name, settings in SCENARIOS.items():
+        trace = record(name, settings)
+        with open(os.path.join(TRACE_DIRECTORY, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+        print(f"{name}: {trace['turns']} turns, {len(trace['keys'])} keys.")
+
+
+if __name__ == "__main__":
+    main()
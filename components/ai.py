@@ -7,6 +7,7 @@ import numpy as np
 import tcod
 
 from resources.actions import Action, MeleeAction, MovementAction, WaitAction, BumpAction
+from resources.metrics import metrics
 
 
 if TYPE_CHECKING:
@@ -14,6 +15,9 @@ if TYPE_CHECKING:
 
 class BaseAI(Action):
 
+    def __init__(self,entity:Actor)->None:
+        # Not counted like actions are, an AI only chooses the actions of its entity.
+        self.entity = entity
 
     def perform(self)-> None:
         raise NotImplementedError()
@@ -27,6 +31,7 @@ class BaseAI(Action):
 
         If there's no valid path then returns an empty list.
         """
+        metrics.count("ai.paths")
         cost = np.array(self.entity.gamemap.tiles["walkable"],dtype = np.int8)
 
         for entity in self.entity.gamemap.entities:
@@ -8,6 +8,7 @@ import components.ai
 from components.base_component import BaseComponent
 import components.inventory
 from resources.exceptions import Impossible
+from resources.telemetry import telemetry
 from resources.input_handlers import (
     ActionOrHandler,
     AreaRangedAttackHandler,
@@ -35,6 +36,7 @@ class Consumable(BaseComponent):
         """Remove the consumed item from its containign inventory."""
         entity = self.parent
         inventory = entity.parent
+        self.engine.items_used += 1
 
         if isinstance(inventory, components.inventory.Inventory):
             inventory.items.remove(entity)
@@ -131,6 +133,12 @@ class FireballDamageConsumable(Consumable):
                 self.engine.message_log.add_message(
                     f"The {actor.name} is engulfed in a fiery explosion, taking {self.damage} damage!"
                 )
+                telemetry.record(
+                    self.engine,"damage",
+                    actor=action.entity.name,target=actor.name,amount=self.damage,
+                    source=self.parent.name,
+                )
+                actor.fighter.last_attacker = self.parent.name
                 actor.fighter.take_damage(self.damage)
                 targets_hit = True
         
@@ -176,6 +184,11 @@ class LightningDamageConsumable(Consumable):
             self.engine.message_log.add_message(
                 f"A lighting bolt strickes the {target.name} with a loud thunder, for {self.damage} damage!"
             )
+            telemetry.record(
+                self.engine,"damage",
+                actor=consumer.name,target=target.name,amount=self.damage,source=self.parent.name,
+            )
+            target.fighter.last_attacker = self.parent.name
             target.fighter.take_damage(self.damage)
             self.consume()
         
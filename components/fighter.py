@@ -5,7 +5,8 @@ from resources import color
 from components.base_component import BaseComponent
 
 from resources.render_order import RenderOrder
-from typing import TYPE_CHECKING
+from resources.telemetry import telemetry
+from typing import Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from resources.entity import Actor
@@ -16,6 +17,9 @@ class Fighter(BaseComponent):
     Defense -> Represents how much taken damage will be reduced.
     Power -> The Entity's Raw Attack Power.
     """
+    # The name of whatever hurt this actor last, the cause of its death if it dies.
+    last_attacker: Optional[str] = None
+
     def __init__(self, hp:int, base_defense:int, base_power:int):
         self.max_hp = hp
         self._hp = hp
@@ -73,16 +77,23 @@ class Fighter(BaseComponent):
             death_message = f"{self.parent.name} is Dead!"
             death_message_color = color.enemy_die
 
+        telemetry.record(
+            self.engine,"death",name=self.parent.name,x=self.parent.x,y=self.parent.y,
+        )
+        self.leave_remains()
+        
+        self.engine.message_log.add_message(death_message,death_message_color)
+
+        self.engine.player.level.add_xp(self.parent.level.xp_given)
+
+    def leave_remains(self)->None:
+        """Turn the parent into its corpse."""
         self.parent.char = "%"
         self.parent.color = (191,0,0)
         self.parent.blocks_movement = False
         self.parent.ai = None
         self.parent.name = f"Remains of {self.parent.name}"
         self.parent.render_order = RenderOrder.CORPSE
-        
-        self.engine.message_log.add_message(death_message,death_message_color)
-
-        self.engine.player.level.add_xp(self.parent.level.xp_given)
     
     # This function will restore a certain amount of HP, up to the maximum and return 
     # The amount that was healed. If the entity's health is at full just return()
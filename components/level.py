@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from components.base_component import BaseComponent
+from resources.telemetry import telemetry
 
 if TYPE_CHECKING:
     from resources.entity import Actor
@@ -64,6 +65,7 @@ class Level(BaseComponent):
             )
     
     def increase_level(self) ->None:
+        telemetry.record(self.engine,"level_up",level=self.current_level + 1)
         self.current_xp -= self.experience_to_next_level
 
     def increase_max_hp(self,amount:int = 20)->None:
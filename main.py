@@ -1,34 +1,160 @@
 #!/usr/bin/env python3
+import sys
+import time
+
+# Measured before anything else is imported, see resources/startup.py.
+launch_time = time.perf_counter()
+from resources import startup
+if startup.REPORT_FLAG in sys.argv:
+    startup.enable(launch_time)
+
+import argparse
+
 import tcod
 import copy
 from resources import color
 import traceback
 from resources import input_handlers
 from resources import exceptions
+from resources import event_queue
+from resources import frame_clock
+from resources.latency import input_latency
+from resources.metrics import metrics
+from resources import run_history
+from resources.run_history import run_store
+from resources.telemetry import telemetry
+from resources.profiler import turn_profiler
+from resources import save_slots
+from resources.save_slots import autosave
 
 
 from resources import setup_game
+from resources import assets
 
+startup.mark("Imports")
 
-def save_game(handler:input_handlers.BaseEventHandler,filename:str) ->None:
-    """If the current event handler has an active Engine then save it."""
-    if isinstance(handler,input_handlers.EventHandler):
-        handler.engine.save_as(filename)
+def save_game(handler:input_handlers.BaseEventHandler) ->None:
+    """If the current event handler has an active Engine then save it in its slot."""
+    if not isinstance(handler,input_handlers.EventHandler):
+        return
+    if save_slots.save(handler.engine) is not None:
         print("Game Saved.")
+        return
+    if handler.engine.savable:
+        print("Every save slot is used by another game, this one wasn't saved.")
+    # Only its spilled messages are left to remove.
+    save_slots.discard_game(handler.engine)
+
+
+def scenario_argument(text:str):
+    """Read --scenario. The scenarios are only imported when one is asked for."""
+    from resources import scenario
+
+    return scenario.argument(text)
+
+
+def enable_rewind(handler:input_handlers.BaseEventHandler,turns:int)->None:
+    """Give the game played in `handler` a rewind history, unless it already has one."""
+    if isinstance(handler,input_handlers.EventHandler) and handler.engine.history is None:
+        handler.engine.enable_rewind(turns)
+
+
+def parse_arguments()->argparse.Namespace:
+    parser = argparse.ArgumentParser(description="El Roguelike de Tato")
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=0,
+        help="Run in real time at this frame rate. By default the game waits for input.",
+    )
+    parser.add_argument(
+        "--key-repeats",
+        type=event_queue.key_repeats_argument,
+        default=event_queue.DEFAULT_KEY_REPEATS_PER_FRAME,
+        metavar="N",
+        help=(
+            "Repeats of a held key played per frame, or 'all'. "
+            f"Defaults to {event_queue.DEFAULT_KEY_REPEATS_PER_FRAME}."
+        ),
+    )
+    parser.add_argument(
+        "--profile-csv",
+        metavar="FILENAME",
+        help="Write how long each phase of every turn took to this CSV file.",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILENAME",
+        help="Append snapshots of the game's counters to this JSON lines file.",
+    )
+    parser.add_argument(
+        "--metrics-every",
+        type=int,
+        metavar="TURNS",
+        default=metrics.every,
+        help="Turns between two snapshots of the counters.",
+    )
+    parser.add_argument(
+        "--telemetry",
+        metavar="FILENAME",
+        help="Record damage, deaths, pickups, level ups and floor changes to this file.",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Trace allocations from the launch, for the memory reports of F5 and new floors.",
+    )
+    parser.add_argument(
+        "--scenario",
+        type=scenario_argument,
+        metavar="SPEC",
+        help="Start a new game on a stress scenario, e.g. 2000x2000,actors=5000.",
+    )
+    parser.add_argument(
+        "--rewind",
+        type=int,
+        default=0,
+        metavar="TURNS",
+        help="Remember this many turns, so Backspace can go back through them.",
+    )
+    parser.add_argument(
+        "--autosave",
+        type=int,
+        default=100,
+        metavar="TURNS",
+        help="Save the game in the background every this many turns, 0 to turn it off.",
+    )
+    parser.add_argument(
+        startup.REPORT_FLAG,
+        action="store_true",
+        help="Print how long the startup took, up to the first frame.",
+    )
+    return parser.parse_args()
 
 
 def main() ->None:
+    arguments = parse_arguments()
+    if arguments.memory:
+        # Before the game exists, so the reports account for all of its allocations.
+        from resources.memory import memory_tracker
+
+        memory_tracker.start()
+
     #Defining Variables for the Screen Size. 
     #Todo: load this values from a JSON File.
     screen_width = 80
     screen_height = 50
 
     #tcod will use our font from dejavu10x10_gs_tc.png
-    tileset = tcod.tileset.load_tilesheet(
-        'src/dejavu10x10_gs_tc.png',32,8,tcod.tileset.CHARMAP_TCOD
-    )
+    tileset = assets.load_tilesheet('src/dejavu10x10_gs_tc.png',32,8)
 
-    handler: input_handlers.BaseEventHandler = setup_game.MainMenu()
+    handler: input_handlers.BaseEventHandler
+    if arguments.scenario:
+        engine = arguments.scenario.build()
+        save_slots.start_session(engine)
+        handler = engine.handlers.main
+    else:
+        handler = setup_game.MainMenu()
         #This creates the Screen
     with tcod.context.new_terminal(
         screen_width,
@@ -37,38 +163,112 @@ def main() ->None:
         title = "El Roguelike de Tato",
         vsync=True,
     ) as context:
+        startup.mark("Window opened")
     
         #Creates the console to display the elements
 
         #By default numpy acceses 2D arrays in [y,x] so this line reverses it to [x,y]
         root_console = tcod.console.Console(screen_width,screen_height,order = "F")
 
+        # The handler, its render key and whether the overlays were shown in the last
+        # presented frame. While they stay the same the screen is already up to date, so the
+        # frame isn't rendered nor presented again.
+        presented_frame = None
+        report_startup = startup.enabled
+
+        if arguments.profile_csv:
+            turn_profiler.open_csv(arguments.profile_csv)
+        if arguments.metrics:
+            metrics.open(arguments.metrics,arguments.metrics_every)
+        if arguments.telemetry:
+            telemetry.open(arguments.telemetry)
+        run_store.open(run_history.DEFAULT_FILENAME)
+        autosave.every = arguments.autosave
+
+        # In real time mode frames are paced by this clock. Background jobs, like autosaves,
+        # are advanced in the time left at the end of each frame.
+        clock = frame_clock.FrameClock(arguments.fps) if arguments.fps > 0 else None
+        jobs = frame_clock.jobs
+
         try:
             
             while True:
-                root_console.clear()
-                handler.on_render(console=root_console)
-                context.present(root_console)
+                if arguments.rewind: # Before the game plays any turn.
+                    enable_rewind(handler,arguments.rewind)
+                render_key = handler.render_key()
+                frame = (handler,render_key,turn_profiler.overlay,input_latency.overlay)
+                if render_key is None or frame != presented_frame:
+                    root_console.clear()
+                    with turn_profiler.phase("render"):
+                        handler.on_render(console=root_console)
+                    if turn_profiler.overlay:
+                        turn_profiler.render(root_console)
+                    if input_latency.overlay:
+                        input_latency.render(root_console)
+                    context.present(root_console)
+                    turn_profiler.end_frame()
+                    presented_frame = None if render_key is None else frame
+                    if report_startup: # Only up to the first frame.
+                        report_startup = False
+                        startup.mark("First frame")
+                        print(startup.report())
+                # The events handled so far are on the screen now, or didn't change it.
+                input_latency.presented()
+
+                if clock is None and jobs:
+                    # Work on the jobs a slice at a time, looking for input in between.
+                    jobs.run(time.perf_counter() + frame_clock.IDLE_SLICE)
+                    queued_events = tcod.event.get()
+                elif clock is None:
+                    # Sleep until there is some input, or until the handler asks to be updated.
+                    queued_events = tcod.event.wait(handler.refresh_interval)
+                else:
+                    clock.run_jobs(jobs)
+                    clock.wait()
+                    queued_events = tcod.event.get()
+                # Each event is stamped with when SDL queued it, the time it waited counts.
+                queued_events = input_latency.stamp(queued_events)
 
                 try:
-                    for event in tcod.event.wait():
+                    # Take the events queued so far, events arriving meanwhile wait for the
+                    # next frame. Whatever the queue holds, it is rendered again soon.
+                    events = event_queue.coalesce_events(queued_events,arguments.key_repeats)
+                    for event in events:
+                        if isinstance(event,tcod.event.WindowEvent):
+                            presented_frame = None # The window must be drawn again.
                         context.convert_event(event)
                         handler = handler.handle_events(event)
+                        input_latency.handled(event)
+                    handler = handler.update()
                 except Exception: #Handle Exceptions in game
                     traceback.print_exc() # Print error to stderr
-                    # Then print the error to the message log.
+                    # Then print the error to the message log, the full traceback stays in stderr.
                     if isinstance(handler,input_handlers.EventHandler):
                         handler.engine.message_log.add_message(
-                            traceback.format_exc(),color.error
+                            traceback.format_exc().splitlines()[-1],color.error
                         )
         except exceptions.QuitWithoutSaving:
             raise
         except SystemExit: #Save and quit
-            save_game(handler,"savegame.sav")
+            save_game(handler)
             raise
         except BaseException: # Save on any other unexpected exceptions
-            save_game(handler,"savegame.sav")
+            save_game(handler)
             raise
+        finally:
+            turn_profiler.close()
+            telemetry.close()
+            run_store.close()
+            metrics.close(
+                handler.engine if isinstance(handler,input_handlers.EventHandler) else None
+            )
+            if clock is not None and clock.stats() is not None:
+                print(f"Frame times: {clock.stats()}")
+            if input_latency.histograms:
+                print(input_latency.report())
+            if arguments.memory:
+                print(f"Wrote {memory_tracker.filename}")
+                memory_tracker.stop()
 
             
 
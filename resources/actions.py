@@ -4,6 +4,8 @@ from typing import Optional,Tuple,TYPE_CHECKING
 
 from resources import color
 from resources import exceptions
+from resources.metrics import metrics
+from resources.telemetry import telemetry
 
 if TYPE_CHECKING:
     from resources.engine import Engine
@@ -12,6 +14,8 @@ class Action:
     def __init__(self,entity:Actor)->None:
         super().__init__()
         self.entity = entity
+        # Actions are made right before being performed, so this counts the actions by type.
+        metrics.count(f"actions.{type(self).__name__}")
 
     @property
     def engine(self)->Engine:
@@ -62,6 +66,7 @@ class PickupAction(Action):
                 inventory.items.append(item)
 
                 self.engine.message_log.add_message(f"You Picked Up The {item.name}!")
+                telemetry.record(self.engine,"pickup",actor=self.entity.name,item=item.name)
                 return
             
         raise exceptions.Impossible("There is nothing here to pick up.")
@@ -173,6 +178,11 @@ class MeleeAction(ActionWithDirection):
             self.engine.message_log.add_message(
                 f"{attack_desc} for {damage} hit points.",attack_color
             )
+            telemetry.record(
+                self.engine,"damage",
+                actor=self.entity.name,target=target.name,amount=damage,source="melee",
+            )
+            target.fighter.last_attacker = self.entity.name
             target.fighter.hp-=damage
         else:
             self.engine.message_log.add_message(
@@ -0,0 +1,53 @@
+"""
+Loading of the image assets in src/.
+
+Decoded images are cached as raw numpy arrays in CACHE_DIRECTORY, next launches read them
+back instead of decoding the PNG again. A cache file older than its source is ignored.
+"""
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import tcod
+
+from resources import startup
+
+CACHE_DIRECTORY = "cache"
+
+
+def cache_filename(filename: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, os.path.basename(filename) + ".npy")
+
+
+def load_image(filename: str) -> np.ndarray:
+    """Return the pixels of an image as an RGBA array indexed [y, x]."""
+    cached = cache_filename(filename)
+    with startup.timed_asset(filename):
+        try:
+            if os.path.getmtime(cached) >= os.path.getmtime(filename):
+                return np.load(cached)
+        except (OSError, ValueError):
+            pass # Missing or unreadable cache, decode the image.
+
+        image = np.ascontiguousarray(tcod.image.load(filename))
+        try:
+            os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+            temporary_filename = f"{cached}.tmp"
+            with open(temporary_filename, "wb") as f:
+                np.save(f, image)
+            os.replace(temporary_filename, cached)
+        except OSError:
+            pass # The cache is only an optimization.
+        return image
+
+
+def load_tilesheet(filename: str, columns: int, rows: int) -> tcod.tileset.Tileset:
+    """
+    Load the font of the game.
+
+    The tilesheet isn't cached: rebuilding a Tileset tile by tile from a cached array takes
+    as long as libtcod decoding the small PNG.
+    """
+    with startup.timed_asset(filename):
+        return tcod.tileset.load_tilesheet(filename, columns, rows, tcod.tileset.CHARMAP_TCOD)
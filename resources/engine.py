@@ -1,28 +1,56 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import Hashable, Optional, TYPE_CHECKING
+import itertools
 
-import lzma
-import pickle
 from tcod.console import Console
 from tcod.map import compute_fov
 
 # To handle the Exceptions error messages.
 from resources import exceptions
+from resources import save_file
+from resources.metrics import metrics
+from resources.profiler import profile_capture, turn_profiler
+from resources.save_slots import autosave
 
 #from actions import EscapeAction,MovementAction
 
 from resources.message_log import MessageLog
-from resources import render_functions
+from resources.hud import hud
 
 
 
+# Shared by every Engine so a change number is never reused, not even after a rewind.
+change_numbers = itertools.count(1)
+
 if TYPE_CHECKING:
     from resources.entity import Actor
     from resources.game_map import GameMap,GameWorld
+    from resources.input_handlers import HandlerStack
+    from resources.rewind import TurnHistory
+    from resources.snapshot import EngineSnapshot
 class Engine:
     game_map: GameMap
     game_world:GameWorld
+
+    # Attributes that only belong to the running session. They are not saved nor
+    # copied by snapshots.
+    TRANSIENT = ("history","handler_stack")
+    history: Optional[TurnHistory] = None
+    handler_stack: Optional[HandlerStack] = None
+
+    turn: int = 0 # Saves made before turns were counted start from 0.
+    save_slot: Optional[int] = None # The save slot of this session, None until it's saved.
+    # When every slot was used as the game started, the one the player agreed to replace.
+    replace_slot: Optional[int] = None
+    savable: bool = True # False for games which never take a save slot, like stress scenarios.
+    # True for copies made by fork and snapshots, played by bots and tools. Their turns don't
+    # reach the game's records: metrics, profiles, telemetry, autosaves and the run history.
+    simulated: bool = False
+    changes: int = 0 # Changes every time the game state changes, see mark_changed.
+    # Kept in the run history when the game ends, see run_history.
+    seed: Optional[int] = None # The random seed the game started with, when it is known.
+    items_used: int = 0
     # The init function takes three arguments:
     """
     entities: A set of entities which behaves kind a list of enforces uniqueness. We can't add an Entity to the set twice.
@@ -34,14 +62,43 @@ class Engine:
         self.message_log = MessageLog()
         self.mouse_location = (0,0)
         self.player = player
+        self.turn = 0
     
+    def __getstate__(self)->dict:
+        state = self.__dict__.copy()
+        for name in self.TRANSIENT:
+            state.pop(name,None)
+        return state
+
+    @property
+    def handlers(self)->HandlerStack:
+        """The event handlers of this session, made the first time they are needed."""
+        if self.handler_stack is None:
+            from resources.input_handlers import HandlerStack
+
+            self.handler_stack = HandlerStack(self)
+        return self.handler_stack
+
+    def mark_changed(self)->None:
+        """Tell the renderer that the game state changed and the screen should be redrawn."""
+        self.changes = next(change_numbers)
+
+    def render_key(self)->Hashable:
+        """A value that is the same as long as what `render` draws doesn't change."""
+        return self.changes, self.message_log.changes, self.mouse_location
+
     def handle_enemy_turns(self)-> None:
-        for entity in set(self.game_map.actors) - {self.player}:
+        # Enemies act from the top left to the bottom right. The actors are kept in a set, whose
+        # order changes from a run to another, so the same game could play out differently.
+        enemies = sorted(
+            set(self.game_map.actors) - {self.player}, key=lambda actor: (actor.y, actor.x)
+        )
+        for entity in enemies:
             if entity.ai:
                 try:
                     entity.ai.perform()
                 except exceptions.Impossible:
-                    pass #Ignore impossible action exceptions from AI
+                    metrics.count("impossible.ai") #Ignore impossible action exceptions from AI
         
 
     
@@ -53,6 +110,7 @@ class Engine:
     """
     def update_fov(self) -> None:
         """Recompute the visible area based on the player's POV"""
+        metrics.count("fov.updates")
         self.game_map.visible[:] = compute_fov(
             self.game_map.tiles["transparent"],
             (self.player.x,self.player.y),
@@ -72,33 +130,63 @@ class Engine:
         self.game_map.render(console)
         self.message_log.render(console=console,x=21,y=45,width=40,height=5)
 
-        render_functions.render_bar(
-            console = console,
-            current_value=self.player.fighter.hp,
-            maximum_value=self.player.fighter.max_hp,
-            total_width=20,
-        )
-
-        render_functions.render_dungeon_level(
-            console=console,
-            dungeon_level = self.game_world.current_floor,
-            location = (0,47),
-            )
-        
-        render_functions.render_names_at_mouse_location(
-            console = console, x = 21, y = 44, engine = self
-        )
+        # The health bar, the dungeon level and the names under the mouse. See resources/hud.py.
+        hud.render(console,self)
 
 
     """
-    pickle.dumps serializes an object hierarchy in Python. lzma.compress compresses the data, 
-    so it takes up less space. We then use with open(filename, "wb") as f: to write the file 
-    (wb means “write in binary mode”), calling f.write(save_data) to write the data.
+    The save is split in sections (see save_file) which are pickled and compressed with lzma
+    separately, so loading it can skip the bulky parts until they are needed.
     """
     def save_as(self,filename:str)->None:
         """Save this Engine instance as a compressed file."""
-        save_data = lzma.compress(pickle.dumps(self))
-        with open(filename, "wb") as f:
-            f.write(save_data)
-        
-    
+        save_file.write(filename,save_file.dump_engine(self))
+
+    # Snapshots copy the game state without pickling it, so bots and balance tools can try
+    # many moves per turn: take a snapshot, fork it as many times as needed and play on the forks.
+    def snapshot(self)->EngineSnapshot:
+        """Return a frozen copy of this session which can be restored later."""
+        from resources.snapshot import EngineSnapshot
+
+        return EngineSnapshot(self)
+
+    def restore(self,snapshot:EngineSnapshot)->None:
+        """Replace the state of this Engine with the one stored in `snapshot`."""
+        snapshot.restore(self)
+        self.mark_changed()
+
+    def fork(self)->Engine:
+        """Return an independent copy of this session."""
+        from resources.snapshot import clone
+
+        return clone(self)
+
+    # The rewind history keeps a snapshot per turn, it is meant for debugging the AI and
+    # for tests, so it stays off unless it's asked for.
+    def enable_rewind(self,turns:int)->None:
+        """Remember the last `turns` turns so they can be rewound."""
+        from resources.rewind import TurnHistory
+
+        self.history = TurnHistory(turns)
+        self.history.record(self)
+
+    def end_turn(self)->None:
+        """Count a finished turn, store it in the rewind history if there is one and autosave."""
+        self.turn += 1
+        self.mark_changed()
+        if not self.simulated:
+            turn_profiler.end_turn(self.turn)
+            profile_capture.end_turn(self)
+            metrics.end_turn(self)
+            autosave.end_turn(self)
+        if self.history is not None:
+            self.history.record(self)
+
+    def rewind(self,turns:int = 1)->bool:
+        """Go back `turns` turns. Returns False if those turns aren't remembered."""
+        if self.history is None or not self.history.rewind(self,turns):
+            return False
+        self.mark_changed()
+        return True
+
+
@@ -0,0 +1,67 @@
+"""
+Prepare the events of a frame before they are handled.
+
+The events waiting at the start of a frame are handled together, then the frame is rendered
+once. Before that, events which would only repeat work are merged or dropped:
+
+- Consecutive mouse motions become a single motion to where the mouse ended.
+- Key repeats sent by the system while a key is held are limited per frame. When the game
+  can't keep up with the repeat rate they would pile up, and the player would keep walking
+  after the key is released.
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+import tcod.event
+
+# Repeats of a held key played per frame. Each one is a full turn, played back to back with the
+# others before the frame is rendered. None plays every repeat.
+DEFAULT_KEY_REPEATS_PER_FRAME: Optional[int] = 2
+
+
+def key_repeats_argument(text: str) -> Optional[int]:
+    """Read the repeats played per frame given on the command line: a number, or `all`."""
+    if text == "all":
+        return None
+    try:
+        repeats = int(text)
+    except ValueError:
+        repeats = -1
+    if repeats < 0:
+        raise argparse.ArgumentTypeError(f"Expected a number of repeats or 'all', got {text!r}.")
+    return repeats
+
+
+def merge_motions(
+        first: tcod.event.MouseMotion, last: tcod.event.MouseMotion,
+) -> tcod.event.MouseMotion:
+    """Return a motion going from where `first` started to where `last` ended."""
+    return tcod.event.MouseMotion(
+        position=last.position,
+        motion=(first.motion[0] + last.motion[0], first.motion[1] + last.motion[1]),
+        state=last.state,
+    )
+
+
+def coalesce_events(
+        events: Iterable[tcod.event.Event],
+        key_repeats_per_frame: Optional[int] = DEFAULT_KEY_REPEATS_PER_FRAME,
+) -> List[tcod.event.Event]:
+    """Return the events of a frame with the redundant ones merged or dropped, in order."""
+    coalesced: List[tcod.event.Event] = []
+    repeats: Dict[int, int] = {} # Repeats kept so far, per key.
+    for event in events:
+        if isinstance(event, tcod.event.MouseMotion):
+            if coalesced and isinstance(coalesced[-1], tcod.event.MouseMotion):
+                coalesced[-1] = merge_motions(coalesced[-1], event)
+                continue
+        elif isinstance(event, tcod.event.KeyDown) and event.repeat:
+            if key_repeats_per_frame is not None:
+                count = repeats.get(event.sym, 0)
+                if count >= key_repeats_per_frame:
+                    continue
+                repeats[event.sym] = count + 1
+        coalesced.append(event)
+    return coalesced
@@ -0,0 +1,104 @@
+"""
+Frame pacing for the real time loop: a fixed frame rate, a time budget per frame and
+statistics about how long frames take.
+"""
+from __future__ import annotations
+
+import collections
+import time
+import traceback
+from typing import Deque, Generator, Optional
+
+import numpy as np
+
+# A job is a generator doing a bit of work each time it is advanced, so it can be spread over
+# the spare time of many frames.
+Job = Generator[None, None, None]
+
+# Jobs stop this many seconds before the deadline, so their last step doesn't make the frame late.
+JOB_MARGIN = 0.002
+# When the game waits for input, jobs run for this long between two looks at the event queue.
+IDLE_SLICE = 1 / 60
+
+
+class JobQueue:
+    """
+    The background jobs of the game, like autosaves. They run on the main thread, between
+    frames: `run` advances them in turns until a deadline.
+    """
+
+    def __init__(self) -> None:
+        self.pending: Deque[Job] = collections.deque()
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def add(self, job: Job) -> None:
+        self.pending.append(job)
+
+    def run(self, deadline: float) -> None:
+        """Advance the jobs until they are all done or `deadline` is JOB_MARGIN seconds away."""
+        while self.pending and deadline - time.perf_counter() > JOB_MARGIN:
+            job = self.pending.popleft()
+            try:
+                next(job)
+            except StopIteration:
+                continue
+            except Exception:
+                traceback.print_exc() # A broken job is dropped, the game goes on.
+                continue
+            self.pending.append(job)
+
+
+jobs = JobQueue()
+
+
+class FrameClock:
+    """
+    Keeps frames `1 / fps` seconds apart.
+
+    Each frame has a deadline. Work done in a frame should stop once `remaining` is 0, and
+    `wait` sleeps until the deadline. A frame which runs late doesn't make the next ones shorter:
+    the deadlines start again from the current time.
+    """
+
+    def __init__(self, fps: float, history: int = 600):
+        self.frame_time = 1 / fps
+        self.deadline = time.perf_counter() + self.frame_time
+        self.frame_start = time.perf_counter()
+        # How long the last frames took, in seconds, not counting the sleep at their end.
+        self.durations: Deque[float] = collections.deque(maxlen=history)
+        self.frames = 0
+        self.late_frames = 0
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline of this frame."""
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def wait(self) -> None:
+        """End this frame: record how long it took and sleep until its deadline."""
+        now = time.perf_counter()
+        self.durations.append(now - self.frame_start)
+        self.frames += 1
+        if now < self.deadline:
+            time.sleep(self.deadline - now)
+            self.deadline += self.frame_time
+        else:
+            self.late_frames += 1
+            self.deadline = now + self.frame_time
+        self.frame_start = time.perf_counter()
+
+    def run_jobs(self, queue: JobQueue) -> None:
+        """Advance the jobs of `queue` in the time left in this frame."""
+        queue.run(self.deadline)
+
+    def stats(self) -> Optional[str]:
+        """Describe the time taken by the last frames, or return None before the first frame."""
+        if not self.durations:
+            return None
+        durations = np.array(self.durations) * 1000
+        return (
+            f"{self.frames} frames, {self.late_frames} late. Last {len(durations)}: "
+            f"mean {durations.mean():.2f}ms, p95 {np.percentile(durations, 95):.2f}ms, "
+            f"max {durations.max():.2f}ms, budget {self.frame_time * 1000:.2f}ms"
+        )
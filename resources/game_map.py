@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Iterable,Iterator, Optional, TYPE_CHECKING
+from typing import Iterable,Iterator, Optional, Tuple, TYPE_CHECKING
 import numpy as np #type: ignore
 from tcod.console import Console
 
@@ -13,6 +13,11 @@ if TYPE_CHECKING:
     from resources.engine import Engine
     from resources.entity import Entity
 
+# The part of the screen showing the map, above the message log and the HUD. Bigger maps
+# scroll with the player.
+VIEW_WIDTH = 80
+VIEW_HEIGHT = 43
+
 class GameMap:
     
     # The initializer takes width and height integers and assigns them in one line.
@@ -79,6 +84,32 @@ class GameMap:
         """Return True if x and y are inside of the bounds of this map."""
         return 0<=x<self.width and 0<=y<self.height
     
+    # The view is the part of the map drawn on the screen. Maps which fit in it are drawn whole,
+    # bigger ones are drawn around the player.
+    def view_origin(self)->Tuple[int,int]:
+        """Return the map location drawn at the top left corner of the screen."""
+        player = self.engine.player
+        x = max(0,min(player.x - VIEW_WIDTH // 2,self.width - VIEW_WIDTH))
+        y = max(0,min(player.y - VIEW_HEIGHT // 2,self.height - VIEW_HEIGHT))
+        return x, y
+
+    def map_to_view(self,x:int,y:int)->Tuple[int,int]:
+        """Return where the map location x, y is drawn on the screen."""
+        origin_x, origin_y = self.view_origin()
+        return x - origin_x, y - origin_y
+
+    def view_to_map(self,x:int,y:int)->Tuple[int,int]:
+        """Return the map location drawn at x, y on the screen."""
+        origin_x, origin_y = self.view_origin()
+        return x + origin_x, y + origin_y
+
+    def in_view(self,x:int,y:int)->bool:
+        """Return True if the map location x, y is inside the map and drawn on the screen."""
+        view_x, view_y = self.map_to_view(x,y)
+        return (
+            self.in_bounds(x,y) and 0 <= view_x < VIEW_WIDTH and 0 <= view_y < VIEW_HEIGHT
+        )
+
     # Using the console class's tiles_rgb method, now we render the entire map.
     # Much faster than console.print.
     def render(self,console:Console)->None:
@@ -90,9 +121,14 @@ class GameMap:
         Otherwise the default is "SHROUD".
         
         """
-        console.rgb[0 : self.width, 0 : self.height] = np.select(
-            condlist = [self.visible,self.explored],
-            choicelist = [self.tiles["light"],self.tiles["dark"]],
+        origin_x, origin_y = self.view_origin()
+        width = min(self.width,VIEW_WIDTH)
+        height = min(self.height,VIEW_HEIGHT)
+        view = np.s_[origin_x : origin_x + width, origin_y : origin_y + height]
+
+        console.rgb[0 : width, 0 : height] = np.select(
+            condlist = [self.visible[view],self.explored[view]],
+            choicelist = [self.tiles["light"][view],self.tiles["dark"][view]],
             default = tile_types.SHROUD,
         )
 
@@ -102,10 +138,11 @@ class GameMap:
             self.entities, key = lambda x:x.render_order.value
         )
         for entity in entities_sorted_for_rendering:
-            # Only print entities that are in the FOV
+            # Only print entities that are in the FOV, the FOV is always inside the view.
             if self.visible[entity.x,entity.y]:
                 console.print(
-                    x=entity.x,y=entity.y,string = entity.char,fg = entity.color
+                    x=entity.x - origin_x,y=entity.y - origin_y,
+                    string = entity.char,fg = entity.color,
                 )
     
 #Creates a new game map each time we go down a floor, using the variables that 
@@ -140,6 +177,8 @@ class GameWorld:
             self.current_floor = current_floor
     
     def generate_floor(self)->None:
+        from resources.memory import memory_tracker
+        from resources.telemetry import telemetry
         from resources.procgen import generate_dungeon
 
         self.current_floor+=1
@@ -153,4 +192,6 @@ class GameWorld:
 
             engine = self.engine
         )
+        memory_tracker.floor_generated(self.engine) # A memory report, if they were asked for.
+        telemetry.record(self.engine,"floor",floor=self.current_floor)
         
\ No newline at end of file
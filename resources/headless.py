@@ -0,0 +1,301 @@
+"""
+Play the game without a window, driven by a simple bot, for profiling and benchmarks.
+
+The bot presses keys like a player would: its events go through the same handlers as in the
+game, so every phase of a turn runs as usual. Each frame is also rendered to a console which
+is never shown, unless --no-render is given.
+
+    python -m resources.headless --turns 1000 --seed 0
+    python -m resources.headless --turns 1000 --profile 200 --profile-after 500
+    python -m resources.headless --turns 200 --scenario 2000x2000,actors=5000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Callable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+import tcod
+
+from resources import input_handlers
+from resources import scenario
+from resources.input_handlers import MOVE_KEYS
+from resources.latency import input_latency
+from resources.memory import memory_tracker
+from resources.metrics import metrics
+from resources.profiler import profile_capture
+from resources import run_history
+from resources.run_history import run_store
+from resources.telemetry import telemetry
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+SCREEN_WIDTH = 80
+SCREEN_HEIGHT = 50
+
+# The bot drinks a potion below this fraction of its health.
+LOW_HP = 0.4
+
+DIRECTION_KEYS = {direction: key for key, direction in MOVE_KEYS.items()}
+
+
+class Bot:
+    """
+    Explores each floor and takes the stairs once it has found them.
+
+    With `explore` above 0 it keeps exploring until that fraction of the floor is explored.
+    """
+
+    def __init__(self, seed: int = 0, explore: float = 0.0):
+        self.random = random.Random(seed)
+        self.explore = explore
+        self.target: Optional[Tuple[int, int]] = None
+        self.pending_key: Optional[tcod.event.KeySym] = None # Pressed once the inventory opens.
+
+    def choose_key(self, handler: input_handlers.BaseEventHandler) -> tcod.event.KeySym:
+        """Return the key to press next."""
+        if isinstance(handler, input_handlers.LevelUpEventHandler):
+            return tcod.event.KeySym.a + self.random.randrange(3)
+        if not isinstance(handler, input_handlers.MainGameEventHandler):
+            return tcod.event.KeySym.ESCAPE # Leave any other menu.
+
+        engine = handler.engine
+        player = engine.player
+        game_map = engine.game_map
+
+        if player.fighter.hp < player.fighter.max_hp * LOW_HP:
+            for i, item in enumerate(player.inventory.items):
+                if item.name == "Health Potion":
+                    self.pending_key = tcod.event.KeySym.a + i
+                    return tcod.event.KeySym.i
+        for actor in game_map.actors:
+            if actor is not player and max(abs(actor.x - player.x), abs(actor.y - player.y)) == 1:
+                return DIRECTION_KEYS[actor.x - player.x, actor.y - player.y] # Attack it.
+
+        room_for_items = len(player.inventory.items) < player.inventory.capacity
+        visible_items = [item for item in game_map.items if game_map.visible[item.x, item.y]]
+        if room_for_items and any(
+            item.x == player.x and item.y == player.y for item in visible_items
+        ):
+            return tcod.event.KeySym.g
+
+        stairs = game_map.down_stairs_location
+        if (player.x, player.y) == stairs:
+            self.target = None
+            return tcod.event.KeySym.x
+        if room_for_items and visible_items:
+            self.target = min(
+                ((item.x, item.y) for item in visible_items),
+                key=lambda xy: player.distance(*xy),
+            )
+        elif game_map.explored[stairs] and self.explored_enough(engine):
+            self.target = stairs
+        elif self.target is None or game_map.explored[self.target]:
+            self.target = self.unexplored_tile(engine)
+
+        step = self.step_towards(engine, self.target) if self.target else None
+        if step is None:
+            self.target = None
+            step = self.random.choice(list(DIRECTION_KEYS))
+        return DIRECTION_KEYS[step]
+
+    def explored_enough(self, engine: Engine) -> bool:
+        if not self.explore:
+            return True
+        walkable = engine.game_map.tiles["walkable"]
+        explored = np.count_nonzero(walkable & engine.game_map.explored)
+        return explored >= self.explore * np.count_nonzero(walkable)
+
+    def unexplored_tile(self, engine: Engine) -> Optional[Tuple[int, int]]:
+        game_map = engine.game_map
+        candidates = np.argwhere(game_map.tiles["walkable"] & ~game_map.explored)
+        if not len(candidates):
+            return None
+        x, y = candidates[self.random.randrange(len(candidates))]
+        return int(x), int(y)
+
+    def step_towards(self, engine: Engine, target: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        """Return the direction of the first step of a path to `target`."""
+        player = engine.player
+        cost = np.array(engine.game_map.tiles["walkable"], dtype=np.int8)
+        graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
+        pathfinder = tcod.path.Pathfinder(graph)
+        pathfinder.add_root((player.x, player.y))
+        path = pathfinder.path_to(target)
+        if len(path) < 2:
+            return None
+        x, y = path[1]
+        return int(x) - player.x, int(y) - player.y
+
+
+def play(
+        engine: Engine,
+        turns: int,
+        seed: int = 0,
+        render: bool = True,
+        on_turn: Optional[Callable[[Engine], None]] = None,
+        bot: Optional[Bot] = None,
+        record: Optional[List[int]] = None,
+) -> int:
+    """
+    Let the bot play `turns` turns, or until it dies. Returns the turns played.
+
+    The keys pressed are appended to `record` if given, see `replay`.
+    """
+    if bot is None:
+        bot = Bot(seed)
+    console = tcod.console.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+    handler: input_handlers.BaseEventHandler = engine.handlers.main
+    start_turn = engine.turn
+
+    def press(key: int) -> None:
+        nonlocal handler
+        event = tcod.event.KeyDown(0, key, 0)
+        arrived = time.perf_counter()
+        handler = handler.handle_events(event)
+        input_latency.handled(event, arrived)
+        if record is not None:
+            record.append(int(key))
+
+    # Bumping into walls doesn't spend a turn, so the bot gets a few presses per turn.
+    presses = turns * 10
+    while engine.turn - start_turn < turns and presses > 0:
+        if isinstance(handler, input_handlers.GameOverEventHandler):
+            break
+        presses -= 1
+        turn = engine.turn
+        press(bot.choose_key(handler))
+        if bot.pending_key is not None and isinstance(handler, input_handlers.InventoryEventHandler):
+            press(bot.pending_key)
+            bot.pending_key = None
+        if render:
+            handler.on_render(console)
+        input_latency.presented() # Measured up to the render, there is nothing to present.
+        if engine.turn != turn and on_turn is not None:
+            on_turn(engine)
+    return engine.turn - start_turn
+
+
+def replay(engine: Engine, keys: Sequence[int], render: bool = True) -> int:
+    """Press `keys` in order, as recorded by `play`. Returns the turns played."""
+    console = tcod.console.Console(SCREEN_WIDTH, SCREEN_HEIGHT, order="F")
+    handler: input_handlers.BaseEventHandler = engine.handlers.main
+    start_turn = engine.turn
+    for key in keys:
+        if isinstance(handler, input_handlers.GameOverEventHandler):
+            break
+        handler = handler.handle_events(tcod.event.KeyDown(0, key, 0))
+        if render:
+            handler.on_render(console)
+    return engine.turn - start_turn
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Play the game without a window.")
+    parser.add_argument("--turns", type=int, default=1000, help="Turns to play.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the dungeon and the bot.")
+    parser.add_argument(
+        "--no-render", action="store_true", help="Don't render the frames, only play the turns."
+    )
+    parser.add_argument(
+        "--profile", type=int, metavar="TURNS", default=0,
+        help="Profile this many turns with cProfile, see resources/profiler.py.",
+    )
+    parser.add_argument(
+        "--profile-after", type=int, metavar="TURNS", default=0,
+        help="Turns played before the profile starts.",
+    )
+    parser.add_argument(
+        "--scenario", type=scenario.argument, metavar="SPEC",
+        help="Play on a stress scenario instead of a new game, see resources/scenario.py.",
+    )
+    parser.add_argument(
+        "--metrics", metavar="FILENAME",
+        help="Append snapshots of the counters to this file, see resources/metrics.py.",
+    )
+    parser.add_argument(
+        "--metrics-every", type=int, metavar="TURNS", default=metrics.every,
+        help="Turns between two snapshots of the counters.",
+    )
+    parser.add_argument(
+        "--telemetry", metavar="FILENAME",
+        help="Record the game events to this file, see resources/telemetry.py.",
+    )
+    parser.add_argument(
+        "--runs", metavar="FILENAME", default=run_history.DEFAULT_FILENAME,
+        help="The run history database each game is recorded in, see resources/run_history.py.",
+    )
+    parser.add_argument(
+        "--rewind", type=int, metavar="TURNS", default=0,
+        help="Keep a rewind history of this many turns, to measure what it costs.",
+    )
+    parser.add_argument(
+        "--memory", action="store_true",
+        help="Write a memory report on every new floor, see resources/memory.py.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    from resources import setup_game
+
+    arguments = parse_arguments()
+    played = 0
+    if arguments.memory:
+        memory_tracker.start()
+    if arguments.metrics:
+        metrics.open(arguments.metrics, arguments.metrics_every)
+    if arguments.telemetry:
+        telemetry.open(arguments.telemetry)
+    run_store.open(arguments.runs, source="bot", batch_size=run_history.BATCH_SIZE)
+
+    def on_turn(engine: Engine) -> None:
+        nonlocal played
+        played += 1
+        if arguments.profile and played == arguments.profile_after:
+            profile_capture.start(engine, arguments.profile)
+
+    # When the bot dies a new game starts, with the next seed, until all the turns are played.
+    start = time.perf_counter()
+    games = 0
+    while played < arguments.turns:
+        seed = arguments.seed + games
+        if arguments.scenario:
+            engine = arguments.scenario.build(seed)
+        else:
+            engine = setup_game.new_game(seed)
+        if arguments.rewind:
+            engine.enable_rewind(arguments.rewind)
+        if arguments.profile and played == arguments.profile_after == 0:
+            profile_capture.start(engine, arguments.profile)
+        games += 1
+        stuck = not play(engine, arguments.turns - played, seed, not arguments.no_render, on_turn)
+        # A capture still running ends with its game, so it only describes that game's turns.
+        profile_capture.stop(engine)
+        if engine.player.is_alive: # Dead players are recorded when they die, see record_run.
+            run_store.add(engine, None)
+        if stuck:
+            break
+        print(f"Game {games}: turn {engine.turn}, floor {engine.game_world.current_floor}.")
+    elapsed = time.perf_counter() - start
+    metrics.close(engine)
+    telemetry.close()
+    run_store.close()
+
+    print(f"{played} turns in {elapsed:.2f}s ({played / elapsed:.0f} turns/s), {games} games.")
+    print(input_latency.report())
+    for filename in profile_capture.written:
+        print(f"Wrote {filename}")
+    if memory_tracker.running:
+        print(f"Wrote {memory_tracker.filename}")
+    if arguments.metrics:
+        print(f"Wrote {arguments.metrics}")
+    if arguments.telemetry:
+        print(f"Wrote {arguments.telemetry}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+The HUD drawn under the map: the health bar, the dungeon level and the names under the mouse.
+
+Each widget is bound to the values it shows and keeps its last drawing in a small console of
+its own. It is drawn again only when those values change, otherwise the drawing is blitted.
+"""
+from __future__ import annotations
+
+from typing import Callable, Hashable, List, Optional, TYPE_CHECKING
+
+import tcod
+
+from resources import render_functions
+from resources.metrics import metrics
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+
+class Widget:
+    """
+    A rectangle of the HUD.
+
+    `bind` returns the values shown by the widget, and `draw` draws them at (0, 0) of the
+    console it is given. `draw` must only depend on those values for the cache to be right.
+    """
+
+    def __init__(
+            self,
+            x: int,
+            y: int,
+            width: int,
+            height: int,
+            bind: Callable[[Engine], Hashable],
+            draw: Callable[[tcod.console.Console, Hashable], None],
+    ):
+        self.x = x
+        self.y = y
+        self.console = tcod.console.Console(width, height, order="F")
+        self.bind = bind
+        self.draw = draw
+        self.value: Optional[Hashable] = None
+        self.drawn = False
+
+    def render(self, console: tcod.console.Console, engine: Engine) -> None:
+        value = self.bind(engine)
+        if not self.drawn or value != self.value:
+            metrics.count("cache.hud.misses")
+            self.console.clear()
+            self.draw(self.console, value)
+            self.value = value
+            self.drawn = True
+        else:
+            metrics.count("cache.hud.hits")
+        self.console.blit(console, dest_x=self.x, dest_y=self.y)
+
+
+class Hud:
+    """The widgets drawn along with the game, in order."""
+
+    def __init__(self, widgets: List[Widget]):
+        self.widgets = widgets
+
+    def render(self, console: tcod.console.Console, engine: Engine) -> None:
+        for widget in self.widgets:
+            widget.render(console, engine)
+
+
+hud = Hud([
+    Widget(
+        0, 45, 20, 1,
+        bind=lambda engine: (engine.player.fighter.hp, engine.player.fighter.max_hp),
+        draw=lambda console, value: render_functions.render_bar(
+            console=console, current_value=value[0], maximum_value=value[1],
+            total_width=20, x=0, y=0,
+        ),
+    ),
+    Widget(
+        0, 47, 20, 1,
+        bind=lambda engine: engine.game_world.current_floor,
+        draw=lambda console, value: render_functions.render_dungeon_level(
+            console=console, dungeon_level=value, location=(0, 0),
+        ),
+    ),
+    Widget(
+        21, 44, 59, 1,
+        bind=lambda engine: render_functions.get_names_at_location(
+            *engine.mouse_location, game_map=engine.game_map
+        ),
+        draw=lambda console, value: console.print(x=0, y=0, string=value),
+    ),
+])
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-import os
-
 #Python's type hinting system
-from typing import Callable, Tuple, Optional,Union, TYPE_CHECKING
+from typing import Callable, Hashable, List, Tuple, Optional,Union, TYPE_CHECKING
+import traceback
 
 #Importing tcod event system to use tcod's event system.
 import tcod.event
@@ -19,7 +18,11 @@ from resources.actions import(
 )
 import resources.color
 from resources.entity import Item
+from resources.game_map import VIEW_HEIGHT, VIEW_WIDTH
 import resources.exceptions
+from resources import layers
+# Timed around every turn, the other tools are imported by the keys and screens using them.
+from resources.profiler import turn_profiler
 
 if TYPE_CHECKING:
     from resources.engine import Engine
@@ -73,6 +76,9 @@ ActionOrHandler = Union[Action,"BaseEventHandler"]
 if a handler is returned the it will become the active handler for future events.
 If an action is returned it will be atrempted adn if it's valid then
 MainGameEventHandler will become the active handler.
+
+Handlers of a game session are kept in the HandlerStack of its Engine (engine.handlers):
+menus are pushed on it when they open and popped when they close.
 """
 
 class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
@@ -86,6 +92,24 @@ class BaseEventHandler(tcod.event.EventDispatch[ActionOrHandler]):
     
     def on_render(self,console:tcod.Console)->None:
         raise NotImplementedError()
+
+    # The main loop only draws a new frame when this value changes, so events which change
+    # nothing on screen (like moving the mouse inside a tile) don't cost a render.
+    def render_key(self)->Optional[Hashable]:
+        """
+        Return a value which stays the same as long as `on_render` would draw the same thing.
+
+        None means the handler doesn't track its changes and is redrawn after every event.
+        """
+        return None
+
+    # Handlers waiting for something other than input, like a game loading, set how often in
+    # seconds the main loop wakes up to call `update` and draw them, even without any event.
+    refresh_interval: Optional[float] = None
+
+    def update(self)->BaseEventHandler:
+        """Called by the main loop after the events of a frame. Returns the next active handler."""
+        return self
     
     def ev_quit(self,event:tcod.event.Quit)->Optional[Action]:
         raise SystemExit()
@@ -100,9 +124,12 @@ class PopupMessage(BaseEventHandler):
 
     def on_render(self,console:tcod.Console)->None:
         """Render the parent and dim the result, then print the message on top."""
-        self.parent.on_render(console)
-        console.rgb["fg"]//=8
-        console.rgb["bg"]//=8
+        parent_key = self.parent.render_key()
+        layers.dimmed_background.composite(
+            console,
+            None if parent_key is None else (self.parent,parent_key),
+            self.render_dimmed_parent,
+        )
 
         console.print(
             console.width //2,
@@ -113,6 +140,13 @@ class PopupMessage(BaseEventHandler):
             alignment = libtcodpy.CENTER,
         )
     
+    def render_dimmed_parent(self,console:tcod.Console)->None:
+        self.parent.on_render(console)
+        layers.dim(console)
+
+    def render_key(self)->Optional[Hashable]:
+        return self.parent.render_key()
+
     def ev_keydown(self,event:tcod.event.KeyDown)->Optional[BaseEventHandler]:
         """Any Key Returns to the Parent Handler."""
         return self.parent
@@ -127,17 +161,21 @@ class EventHandler(BaseEventHandler):
 
     def handle_events(self,event:tcod.event.Event)->BaseEventHandler:
         """Handle events for input handlers with an engine."""
-        action_or_state = self.dispatch(event)
+        with turn_profiler.phase("input"):
+            action_or_state = self.dispatch(event)
         if isinstance(action_or_state,BaseEventHandler):
             return action_or_state
         if self.handle_action(action_or_state):
             #A valid action was performed.
             if not self.engine.player.is_alive:
                 #The player was killed sometime during or after the action.
-                return GameOverEventHandler(self.engine)
+                record_run(self.engine)
+                self.engine.handlers.clear()
+                return self.engine.handlers.push(GameOverEventHandler(self.engine))
             elif self.engine.player.level.requires_level_up:
-                return LevelUpEventHandler(self.engine)
-            return MainGameEventHandler(self.engine) # Return to the main handler.
+                self.engine.handlers.clear()
+                return self.engine.handlers.push(LevelUpEventHandler(self.engine))
+            return self.engine.handlers.clear() # Return to the main handler.
         return self
 
     def handle_action(self,action:Optional[Action])->bool:
@@ -150,26 +188,51 @@ class EventHandler(BaseEventHandler):
             return False
         
         try:
-            action.perform()
+            with turn_profiler.phase("perform"):
+                action.perform()
         except resources.exceptions.Impossible as exc:
+            from resources.metrics import metrics
+
+            metrics.count("impossible.player")
             self.engine.message_log.add_message(exc.args[0],resources.color.impossible)
             return False #Skip Enemy Turn on Exceptions.
         
-        self.engine.handle_enemy_turns()
-        self.engine.update_fov()
+        with turn_profiler.phase("enemies"):
+            self.engine.handle_enemy_turns()
+        with turn_profiler.phase("fov"):
+            self.engine.update_fov()
+        self.engine.end_turn()
         return True
     
     def ev_mousemotion(self,event:tcod.event.MouseButton)->None:
-        if self.engine.game_map.in_bounds(event.tile.x,event.tile.y):
-            self.engine.mouse_location = event.tile.x , event.tile.y
+        x, y = self.engine.game_map.view_to_map(event.tile.x,event.tile.y)
+        if self.engine.game_map.in_view(x,y):
+            self.engine.mouse_location = x, y
     
     def on_render(self,console: tcod.Console)->None:
         self.engine.render(console)
 
+    def render_key(self)->Optional[Hashable]:
+        return self.engine.render_key()
+
+    def render_background(self,console:tcod.Console)->None:
+        """
+        Draw the game under a menu or overlay.
+
+        The game is drawn once into the background layer and reused for as long as it
+        doesn't change, so only the overlay itself is drawn on every frame.
+        """
+        layers.background.composite(
+            console,(self.engine,self.engine.render_key()),self.engine.render
+        )
+
 
 # This function make Exits itself when any key is pressed.
 class AskUserEventHandler(EventHandler):
 
+    def on_render(self,console:tcod.Console)->None:
+        """Menus draw on top of the game."""
+        self.render_background(console)
     
     def ev_keydown(self,event:tcod.event.KeyDown) -> Optional[ActionOrHandler]:
         """By Default any key exits the input handler"""
@@ -194,9 +257,9 @@ class AskUserEventHandler(EventHandler):
     def on_exit(self) -> Optional[ActionOrHandler]:
         """Called when the user is trying to exit or cancel an action.
         
-        By default this returns to the main event handler.
+        By default this closes this handler and returns to the one below it.
         """
-        return MainGameEventHandler(self.engine)
+        return self.engine.handlers.pop()
 
 
 class CharacterScreenEventHandler(AskUserEventHandler):
@@ -205,7 +268,8 @@ class CharacterScreenEventHandler(AskUserEventHandler):
     def on_render (self,console:tcod.Console)->None:
         super().on_render(console)
 
-        if self.engine.player.x <=30:
+        player = self.engine.player
+        if self.engine.game_map.map_to_view(player.x,player.y)[0] <= 30: # Where it's drawn.
             x = 40
         else:
             x = 0
@@ -245,7 +309,8 @@ class LevelUpEventHandler(AskUserEventHandler):
     def on_render(self,console:tcod.Console)->None:
         super().on_render(console)
 
-        if self.engine.player.x<=30:
+        player = self.engine.player
+        if self.engine.game_map.map_to_view(player.x,player.y)[0] <= 30: # Where it's drawn.
             x = 40
         else:
             x = 0
@@ -343,7 +408,8 @@ class InventoryEventHandler(AskUserEventHandler):
         if height <=3:
             height = 3
 
-        if self.engine.player.x <=30:
+        player = self.engine.player
+        if self.engine.game_map.map_to_view(player.x,player.y)[0] <= 30: # Where it's drawn.
             x = 40
 
         else:
@@ -390,7 +456,11 @@ class InventoryEventHandler(AskUserEventHandler):
             except IndexError:
                 self.engine.message_log.add_message("Invalid Entry.", resources.color.invalid)
                 return None
-            return self.on_item_selected(selected_item)
+            action_or_state = self.on_item_selected(selected_item)
+            if isinstance(action_or_state,BaseEventHandler):
+                # Items asking for a target replace this menu.
+                return self.engine.handlers.replace(action_or_state)
+            return action_or_state
         return super().ev_keydown(event)
     
     def on_item_selected(self,item:Item)-> Optional[ActionOrHandler]:
@@ -439,7 +509,7 @@ class SelectIndexHandler(AskUserEventHandler):
     def on_render(self,console: tcod.Console) ->None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
-        x, y = self.engine.mouse_location
+        x, y = self.engine.game_map.map_to_view(*self.engine.mouse_location)
         console.rgb["bg"][x,y] = resources.color.white
         console.rgb["fg"][x,y] = resources.color.black
 
@@ -464,9 +534,11 @@ class SelectIndexHandler(AskUserEventHandler):
             dx, dy = MOVE_KEYS[key]
             x += dx*modifier
             y += dy*modifier
-            # Clamp the cursor index to the map size
-            x = max(0,min(x,self.engine.game_map.width-1))
-            y = max(0,min(y,self.engine.game_map.height-1))
+            # Clamp the cursor index to the part of the map on the screen.
+            game_map = self.engine.game_map
+            origin_x, origin_y = game_map.view_origin()
+            x = max(origin_x,min(x,origin_x + min(game_map.width,VIEW_WIDTH) - 1))
+            y = max(origin_y,min(y,origin_y + min(game_map.height,VIEW_HEIGHT) - 1))
 
             self.engine.mouse_location = x,y
             return None
@@ -480,9 +552,10 @@ class SelectIndexHandler(AskUserEventHandler):
             self,event:tcod.event.MouseButtonDown
             ) -> Optional[ActionOrHandler]:
         """Left Click confirms a selection."""
-        if self.engine.game_map.in_bounds(*event.tile):
+        x, y = self.engine.game_map.view_to_map(*event.tile)
+        if self.engine.game_map.in_view(x,y):
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(x,y)
         return super().ev_mousebuttondown(event)
     
     # Abstract method that is implemented by LookHandler.
@@ -496,9 +569,9 @@ class SelectIndexHandler(AskUserEventHandler):
 # used in the case where our player wants to have a look around.
 class LookHandler(SelectIndexHandler):
     """Lets the player look around using the keyboard."""
-    def on_index_selected(self, x:int, y:int) ->MainGameEventHandler:
+    def on_index_selected(self, x:int, y:int) ->BaseEventHandler:
         """Return to main handler."""
-        return MainGameEventHandler(self.engine)
+        return self.engine.handlers.pop()
 
 
 
@@ -534,7 +607,7 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         """Highlight the tile under the cursor."""
         super().on_render(console)
 
-        x,y = self.engine.mouse_location
+        x,y = self.engine.game_map.map_to_view(*self.engine.mouse_location)
 
         # Draw a rectangle around the targeted area, so the player can see the affected tiles.
         console.draw_frame(
@@ -582,7 +655,7 @@ class MainGameEventHandler(EventHandler):
         
         # Press v to see the message log.
         elif key == tcod.event.KeySym.v:
-            return HistoryViewer(self.engine)
+            return self.engine.handlers.push(HistoryViewer(self.engine))
 
         # Press g to pickup an item
         elif key == tcod.event.KeySym.g:
@@ -590,24 +663,118 @@ class MainGameEventHandler(EventHandler):
 
         # Press i to open inventory.
         elif key == tcod.event.KeySym.i:
-            return InventoryActivateEventHandler(self.engine)
+            return self.engine.handlers.push(InventoryActivateEventHandler(self.engine))
 
         # Press d to drop an item
         elif key == tcod.event.KeySym.d:
-            return InventoryDropHandler(self.engine)
+            return self.engine.handlers.push(InventoryDropHandler(self.engine))
 
         elif key == tcod.event.KeySym.c:
-            return CharacterScreenEventHandler(self.engine)
+            return self.engine.handlers.push(CharacterScreenEventHandler(self.engine))
         elif key == tcod.event.KeySym.SLASH:
-            return LookHandler(self.engine)
+            return self.engine.handlers.push(LookHandler(self.engine))
+
+        # Press F3 to show how long each phase of the last turns took.
+        elif key == tcod.event.KeySym.F3:
+            turn_profiler.toggle_overlay()
+
+        # Press F4 to profile the next turns with cProfile, or to stop early.
+        elif key == tcod.event.KeySym.F4:
+            from resources.profiler import profile_capture
+
+            if profile_capture.running:
+                profile_capture.stop(self.engine)
+            else:
+                profile_capture.start(self.engine)
+
+        # Press F5 to write a memory report now, one is also written every time a floor is
+        # generated. Allocations are only traced when the game was started with --memory.
+        elif key == tcod.event.KeySym.F5:
+            from resources.memory import memory_tracker
+
+            if memory_tracker.running:
+                memory_tracker.write_report(self.engine)
+                self.engine.message_log.add_message(
+                    f"Memory report written to {memory_tracker.filename}",
+                    resources.color.white,
+                )
+            else:
+                self.engine.message_log.add_message(
+                    "Start the game with --memory to write memory reports.",
+                    resources.color.white,
+                )
+
+        # Press F6 to show how long inputs take to show up on the screen.
+        elif key == tcod.event.KeySym.F6:
+            from resources.latency import input_latency
+
+            input_latency.toggle_overlay()
+
+        # Press backspace to go back one turn, only when the rewind history is enabled.
+        elif key == tcod.event.KeySym.BACKSPACE:
+            if not self.engine.rewind():
+                self.engine.message_log.add_message(
+                    "There is no turn to go back to.",resources.color.impossible
+                )
         #We return the action.
         return action
     
+class HandlerStack:
+    """
+    The handlers of a game session: the main game handler at the bottom and the menus opened
+    over it on top. The main handler is made once and reused every turn.
+    """
+
+    def __init__(self,engine:Engine):
+        self.main = MainGameEventHandler(engine)
+        self.overlays: List[EventHandler] = []
+
+    @property
+    def top(self)->EventHandler:
+        """The active handler."""
+        return self.overlays[-1] if self.overlays else self.main
+
+    def push(self,handler:EventHandler)->EventHandler:
+        """Open `handler` over the active one, and return it."""
+        self.overlays.append(handler)
+        return handler
+
+    def pop(self)->EventHandler:
+        """Close the active handler and return the one below it."""
+        if self.overlays:
+            self.overlays.pop()
+        return self.top
+
+    def replace(self,handler:EventHandler)->EventHandler:
+        """Close the active handler and open `handler` in its place."""
+        self.pop()
+        return self.push(handler)
+
+    def clear(self)->EventHandler:
+        """Close every menu and return the main handler."""
+        self.overlays.clear()
+        return self.main
+
+
+def record_run(engine:Engine)->None:
+    """Keep the stats of the run that just ended in the run history."""
+    if engine.simulated:
+        return # A bot's look-ahead, not a run.
+    from resources.run_history import run_store
+
+    try:
+        run_store.add(engine,engine.player.fighter.last_attacker)
+    except Exception:
+        # The history is only statistics, the game over screen must still show up.
+        traceback.print_exc() # Print to stderr
+
+
 class GameOverEventHandler(EventHandler):
     def on_quit(self)->None:
         """Handle exiting out of a finished game."""
-        if os.path.exists("savegame.sav"):
-            os.remove("savegame.sav")# Deletes the active save file.
+        from resources import save_slots
+
+        save_slots.discard_game(self.engine) # Deletes the save of this game, if any.
         raise resources.exceptions.QuitWithoutSaving() # Avoid saving a finished game
     
     def ev_quit(self, event:tcod.event.Quit)->None:
@@ -629,11 +796,15 @@ class HistoryViewer(EventHandler):
 
     def __init__(self, engine: Engine):
         super().__init__(engine)
-        self.log_length = len(engine.message_log.messages)
+        self.history = engine.message_log.history()
+        self.log_length = len(self.history)
         self.cursor = self.log_length - 1
 
+    def render_key(self)->Optional[Hashable]:
+        return self.engine.render_key(), self.cursor
+
     def on_render(self, console: tcod.Console) -> None:
-        super().on_render(console)  # Draw the main state as the background.
+        self.render_background(console)  # Draw the main state as the background.
 
         log_console = tcod.console.Console(console.width - 6, console.height - 6)
 
@@ -643,18 +814,20 @@ class HistoryViewer(EventHandler):
             0, 0, log_console.width, 1, "┤Message history├", alignment=libtcodpy.CENTER
         )
 
-        # Render the message log using the cursor parameter.
+        # Render the message log using the cursor parameter. Every message takes at least a
+        # line, so only the page of messages that can fit before the cursor is read.
+        height = log_console.height - 2
         self.engine.message_log.render_messages(
             log_console,
             1,
             1,
             log_console.width - 2,
-            log_console.height - 2,
-            self.engine.message_log.messages[: self.cursor + 1],
+            height,
+            self.history.page(self.cursor + 1 - height, self.cursor + 1),
         )
         log_console.blit(console, 3, 3)
 
-    def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[MainGameEventHandler]:
+    def ev_keydown(self, event: tcod.event.KeyDown) -> Optional[BaseEventHandler]:
         # Fancy conditional movement to make it feel right.
         if event.sym in CURSOR_Y_KEYS:
             adjust = CURSOR_Y_KEYS[event.sym]
@@ -672,6 +845,6 @@ class HistoryViewer(EventHandler):
         elif event.sym == tcod.event.KeySym.END:
             self.cursor = self.log_length - 1  # Move directly to the last message.
         else:  # Any other key moves back to the main game state.
-            return MainGameEventHandler(self.engine)
+            return self.engine.handlers.pop()
         return None
 
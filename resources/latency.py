@@ -0,0 +1,153 @@
+"""
+Input latency: the time from an input event arriving to the present of the frame showing
+its result, which is what players feel.
+
+Each event is stamped with the time SDL queued it, so the time it waited in the queue while
+the game was busy counts too. Every event handled is kept with its stamp until the next frame
+is presented (or found up to date). The latencies
+are then added to a histogram per event type, shown in an overlay (F6) and printed at exit.
+
+The buckets grow geometrically, so a few dozen integers cover from a tenth of a millisecond
+to seconds, with about the same relative precision everywhere.
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+from tcod.cffi import lib
+
+from resources import color
+
+if TYPE_CHECKING:
+    import tcod
+
+# Upper edge of the first bucket, in seconds. Each bucket is BUCKET_GROWTH times wider than
+# the previous one, the last one takes everything above about 6.5 seconds.
+MIN_LATENCY = 1e-4
+BUCKET_GROWTH = 2 ** 0.25
+BUCKETS = 65
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def bucket(seconds: float) -> int:
+    """The index of the bucket counting `seconds`."""
+    if seconds <= MIN_LATENCY:
+        return 0
+    return min(BUCKETS - 1, math.ceil(math.log(seconds / MIN_LATENCY, BUCKET_GROWTH)))
+
+
+def arrival_time(event: tcod.event.Event) -> float:
+    """
+    When SDL queued `event`, on the time.perf_counter clock. It must be called as the event is
+    taken from the queue: tcod reuses the same SDL event for every event it takes.
+    """
+    now = time.perf_counter()
+    if event.sdl_event is None: # Not every event keeps its SDL event, nor did SDL queue all of them.
+        return now
+    # SDL stamps its events in milliseconds since it started, a 32 bit count which wraps around.
+    waited = (lib.SDL_GetTicks() - event.sdl_event.common.timestamp) & 0xFFFFFFFF
+    return now - waited / 1000
+
+
+class Histogram:
+    """Counts of latencies per bucket, along with their number, sum and maximum."""
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """An upper bound of the given percentile, the top of the bucket holding it."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(MIN_LATENCY * BUCKET_GROWTH ** index, self.max)
+        return self.max
+
+
+class InputLatency:
+    """The latency histograms by event type, and the events waiting for their frame."""
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+        self.pending: List[Tuple[str, float]] = []
+        self.arrivals: Dict[int, float] = {} # When the events being handled were queued, by id.
+        self.overlay = False
+
+    def stamp(self, events: Iterable[tcod.event.Event]) -> Iterator[tcod.event.Event]:
+        """Yield `events` as they are taken from the queue, noting when each one was queued."""
+        self.arrivals.clear() # The events of the previous frame were handled.
+        for event in events:
+            self.arrivals[id(event)] = arrival_time(event)
+            yield event
+
+    def handled(self, event: tcod.event.Event, arrived: Optional[float] = None) -> None:
+        """
+        Remember that `event` was handled. It arrived at `arrived` (time.perf_counter), or when
+        `stamp` saw it queued. Events made up from others, like merged mouse motions, weren't
+        stamped: they count from the oldest event of their frame, an upper bound.
+        """
+        if arrived is None:
+            arrived = self.arrivals.get(id(event))
+        if arrived is None:
+            arrived = min(self.arrivals.values(), default=time.perf_counter())
+        self.pending.append((type(event).__name__, arrived))
+
+    def presented(self) -> None:
+        """The frame reflecting the events handled so far is on the screen."""
+        if not self.pending:
+            return
+        now = time.perf_counter()
+        for name, arrived in self.pending:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(now - arrived)
+        self.pending.clear()
+
+    def toggle_overlay(self) -> None:
+        self.overlay = not self.overlay
+
+    def rows(self) -> List[str]:
+        """A line per event type: the number of events and the percentiles in milliseconds."""
+        header = f"{'event':<14}{'count':>7}" + "".join(
+            f"{f'p{fraction * 100:g}':>7}" for fraction in PERCENTILES
+        ) + f"{'max':>7}"
+        lines = [header]
+        for name, histogram in sorted(self.histograms.items()):
+            values = [histogram.percentile(fraction) for fraction in PERCENTILES]
+            values.append(histogram.max)
+            lines.append(
+                f"{name[:14]:<14}{histogram.count:>7}"
+                + "".join(f"{value * 1000:>7.1f}" for value in values)
+            )
+        return lines
+
+    def render(self, console: tcod.console.Console) -> None:
+        """Draw the latencies in the top left corner."""
+        lines = self.rows()
+        console.draw_frame(
+            x=0, y=0, width=len(lines[0]) + 2, height=len(lines) + 2,
+            title="Input latency (ms)", clear=True, fg=color.white, bg=color.black,
+        )
+        for i, line in enumerate(lines):
+            console.print(1, 1 + i, line)
+
+    def report(self) -> str:
+        return "Input latency (ms):\n" + "\n".join(self.rows())
+
+
+input_latency = InputLatency()
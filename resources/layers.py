@@ -0,0 +1,67 @@
+"""Console layers which are drawn once and composited under overlays while they don't change."""
+from __future__ import annotations
+
+from typing import Callable, Hashable, Optional
+
+import tcod
+
+from resources.metrics import metrics
+
+
+class CachedLayer:
+    """
+    A console holding the last drawing of a layer, and the key it was drawn for.
+
+    The layer is drawn again only when the key changes, otherwise the cached console is
+    blitted as it is. A key of None means the layer can't be cached and is always drawn.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.console: Optional[tcod.console.Console] = None
+        self.key: Optional[Hashable] = None
+        # The counters of this layer's cache in the metrics.
+        self.hits = f"cache.{name}.hits"
+        self.misses = f"cache.{name}.misses"
+
+    def composite(
+            self,
+            console: tcod.console.Console,
+            key: Optional[Hashable],
+            draw: Callable[[tcod.console.Console], None],
+    ) -> None:
+        """Copy this layer to `console`, calling `draw` first if the cache is out of date."""
+        if key is None:
+            draw(console)
+            return
+
+        cached = self.console
+        if (
+            cached is None
+            or key != self.key
+            or (cached.width, cached.height) != (console.width, console.height)
+        ):
+            # Like the root console, layers are indexed [x, y].
+            metrics.count(self.misses)
+            cached = self.console = tcod.console.Console(console.width, console.height, order="F")
+            draw(cached)
+            self.key = key
+        else:
+            metrics.count(self.hits)
+        cached.blit(console)
+
+    def clear(self) -> None:
+        """Forget the cached drawing."""
+        self.console = None
+        self.key = None
+
+
+def dim(console: tcod.console.Console) -> None:
+    """Darken everything drawn on `console`, used behind popups."""
+    console.rgb["fg"] //= 8
+    console.rgb["bg"] //= 8
+
+
+# What is drawn under a menu or an overlay: the game, or the main menu.
+background = CachedLayer("background")
+# The same, darkened, for popup messages.
+dimmed_background = CachedLayer("dimmed_background")
@@ -0,0 +1,166 @@
+"""
+Where the memory goes, floor after floor.
+
+Once started (--memory, in main.py or resources/headless.py), tracemalloc traces every
+allocation from the launch on, and a report is written each time a floor is generated and when
+F5 is pressed. Reports written from the middle of a game would miss what was allocated before,
+so tracing is only started at launch. A report gives:
+
+- The traced memory per module which allocated it.
+- The number and size of the objects of the game, per type: entities, components, messages,
+  maps and their numpy arrays.
+- What grew since the previous floor. A new floor replaces the previous one, so types whose
+  count keeps going up (corpses, messages) are flagged as possible leaks.
+"""
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+REPORT_DIRECTORY = "profiles"
+
+# Frames stored per allocation, only the innermost one is needed to group by module.
+TRACE_FRAMES = 1
+
+# Growth of the traced memory between floors which is flagged, in bytes.
+GROWTH_THRESHOLD = 256 * 1024
+# Types whose count went up on this many reports in a row are flagged.
+GROWING_REPORTS = 3
+
+
+def module_name(filename: str) -> str:
+    """Return the module, or the package outside of this game, a source file belongs to."""
+    if filename.startswith("<"): # Like <frozen importlib._bootstrap>.
+        return filename
+    parts = os.path.normpath(filename).split(os.sep)
+    for root in ("resources", "components", "benchmarks"):
+        if root in parts:
+            path = parts[parts.index(root):]
+            return ".".join(path)[: -len(".py")] if path[-1].endswith(".py") else ".".join(path)
+    if "site-packages" in parts:
+        return parts[parts.index("site-packages") + 1]
+    return f"<{parts[-1]}>"
+
+
+def object_sizes() -> Dict[str, Tuple[int, int]]:
+    """Return the count and shallow size in bytes of the objects of the game, per type."""
+    from components.base_component import BaseComponent
+    from resources.entity import Actor, Entity, Item
+    from resources.game_map import GameMap
+    from resources.message_log import Message
+
+    types = (
+        ("Actor", Actor), ("Item", Item), ("Entity", Entity), ("Component", BaseComponent),
+        ("Message", Message), ("GameMap", GameMap),
+    )
+    totals: Dict[str, List[int]] = {name: [0, 0] for name, _ in types}
+    totals["numpy arrays"] = [0, 0]
+    seen_arrays = set()
+    for obj in gc.get_objects():
+        for name, cls in types:
+            if isinstance(obj, cls):
+                size = sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+                totals[name][0] += 1
+                totals[name][1] += size
+                # Arrays aren't tracked by the garbage collector, they are found through
+                # the objects holding them.
+                for value in vars(obj).values():
+                    if isinstance(value, np.ndarray) and id(value) not in seen_arrays:
+                        seen_arrays.add(id(value))
+                        totals["numpy arrays"][0] += 1
+                        totals["numpy arrays"][1] += value.nbytes
+                break
+    return {name: (count, size) for name, (count, size) in totals.items()}
+
+
+class MemoryTracker:
+    def __init__(self) -> None:
+        self.filename: Optional[str] = None
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self.previous_objects: Dict[str, Tuple[int, int]] = {}
+        # For each type, on how many floors in a row its count went up.
+        self.growing: Dict[str, int] = {}
+
+    @property
+    def running(self) -> bool:
+        return self.filename is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        os.makedirs(REPORT_DIRECTORY, exist_ok=True)
+        self.filename = os.path.join(REPORT_DIRECTORY, f"memory-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.filename = None
+        self.previous = None
+        self.previous_objects = {}
+        self.growing = {}
+
+    def floor_generated(self, engine: Engine) -> None:
+        """Called by GameWorld.generate_floor, writes a report if memory is being tracked."""
+        if self.running:
+            self.write_report(engine)
+
+    def write_report(self, engine: Engine, top: int = 10) -> str:
+        """Append a report of the memory used now to this session's file, and return it."""
+        assert self.filename is not None, "The memory tracker wasn't started."
+        gc.collect() # Only count what is still alive.
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        objects = object_sizes()
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Floor {engine.game_world.current_floor}, turn {engine.turn}: "
+            f"{current / 1024:.0f} KiB traced, peak {peak / 1024:.0f} KiB",
+            "  By module (KiB):",
+        ]
+        modules: Dict[str, int] = {}
+        for statistic in snapshot.statistics("filename"):
+            name = module_name(statistic.traceback[0].filename)
+            modules[name] = modules.get(name, 0) + statistic.size
+        for name, size in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"    {size / 1024:10.1f} {name}")
+
+        lines.append("  By type (count, KiB):")
+        for name, (count, size) in objects.items():
+            before = self.previous_objects.get(name)
+            change = "" if before is None else f" ({count - before[0]:+d})"
+            lines.append(f"    {count:8d}{change:>8} {size / 1024:10.1f} {name}")
+
+        if self.previous is not None:
+            growth = sum(stat.size_diff for stat in snapshot.compare_to(self.previous, "filename"))
+            if growth > GROWTH_THRESHOLD:
+                lines.append(f"  ! Traced memory grew by {growth / 1024:.0f} KiB since the last report.")
+            for name, (count, _) in objects.items():
+                before = self.previous_objects.get(name, (count, 0))[0]
+                self.growing[name] = self.growing.get(name, 0) + 1 if count > before else 0
+                if self.growing[name] >= GROWING_REPORTS:
+                    lines.append(
+                        f"  ! {name} count went up on {self.growing[name]} reports in a row "
+                        f"({count}), is something holding on to them?"
+                    )
+
+        self.previous = snapshot
+        self.previous_objects = objects
+        report = "\n".join(lines)
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.write(report + "\n\n")
+        return report
+
+
+memory_tracker = MemoryTracker()
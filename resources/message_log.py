@@ -1,9 +1,28 @@
-from typing import Iterable,List, Reversible, Tuple
+from __future__ import annotations
+
+from typing import Dict,Iterable,List, Optional, Reversible, Tuple, TYPE_CHECKING
+import json
+import os
 import textwrap
+import weakref
 
+import numpy as np
 import tcod
 
 from resources import color
+from resources.metrics import metrics
+
+if TYPE_CHECKING:
+    from resources.save_file import LazySection
+
+# Messages kept in memory by default, older ones are moved to the log's spill file.
+DEFAULT_CAPACITY = 200
+# Messages are moved out of memory in batches of this size, so the file isn't written every turn.
+SPILL_BATCH = 50
+# Next to each spill file, the offset where each of its lines ends, as 8 byte integers. The
+# history reads the offsets it needs from it instead of scanning the spill file.
+INDEX_SUFFIX = ".idx"
+OFFSET = np.dtype("<i8")
 
 # Will be used to save and display messages in our log. It includes three pieces of information:
 """
@@ -24,10 +43,41 @@ class Message:
             return f"{self.plain_text} (x{self.count})"
         return self.plain_text
 
-# It keeps a list of the message's received.
+# The wrapped lines of each message per width, along with the count they were wrapped for.
+# Entries go away with their message.
+wrap_cache: weakref.WeakKeyDictionary[Message,Dict[int,Tuple[int,Tuple[str,...]]]] = (
+    weakref.WeakKeyDictionary()
+)
+
+# It keeps a list of the last messages received, the older ones are appended to a file on disk.
 class MessageLog:
-    def __init__(self) -> None:
-        self.messages:List[Message] = []
+    # Messages from a loaded save which weren't decoded yet, they come before `recent`.
+    older: Optional[LazySection] = None
+
+    # Defaults for logs saved before they were bounded.
+    capacity: int = DEFAULT_CAPACITY
+    spilled: int = 0 # Messages moved out of memory so far.
+    spill_offset: int = 0 # Bytes of the spill file holding those messages.
+    spill_lines: int = 0 # Messages in the spill file, each with its offset in the index.
+    spill_filename: Optional[str] = None # Without a file the spilled messages are dropped.
+    changes: int = 0 # Counts the messages added, so renderers know when to redraw.
+
+    def __init__(self,capacity:int = DEFAULT_CAPACITY) -> None:
+        self.recent:List[Message] = [] # Every message, once the older ones are decoded.
+        self.capacity = capacity
+
+    def __setstate__(self,state:dict)->None:
+        if "messages" in state: # Saved before the older messages were loaded lazily.
+            state["recent"] = state.pop("messages")
+        self.__dict__.update(state)
+
+    @property
+    def messages(self)->List[Message]:
+        """Every message of this log, the oldest first."""
+        if self.older is not None:
+            self.recent[:0] = self.older.load()
+            self.older = None
+        return self.recent
 
     # Is what adds the message to the log. text is required but fg will just default to
     # White if nothing is given. Stack tells us whether to stack messages or not.
@@ -36,10 +86,42 @@ class MessageLog:
     def add_message(
             self,text:str,fg:Tuple[int,int,int] = color.white,*,stack:bool = True,
     ) -> None:
-        if stack and self.messages and text == self.messages[-1].plain_text:
-            self.messages[-1].count+=1
+        self.changes += 1
+        metrics.count("messages")
+        if stack and self.recent and text == self.recent[-1].plain_text:
+            self.recent[-1].count+=1
         else:
-            self.messages.append(Message(text,fg))
+            self.recent.append(Message(text,fg))
+            if len(self.recent) >= self.capacity + SPILL_BATCH:
+                self.spill(len(self.messages) - self.capacity)
+
+    def spill(self,count:int)->None:
+        """Move the `count` oldest messages in memory to the end of the spill file."""
+        messages = self.messages
+        spilled_messages = messages[:count]
+        del messages[:count]
+
+        if self.spill_filename is not None:
+            lines = [
+                (json.dumps([message.plain_text,message.fg,message.count]) + "\n").encode("utf-8")
+                for message in spilled_messages
+            ]
+            ends = self.spill_offset + np.cumsum([len(line) for line in lines],dtype=OFFSET)
+            # Write at the end of what this log spilled, not at the end of the file: after
+            # a rewind or a crash the file can hold messages this log doesn't know about.
+            write_at(self.spill_filename,self.spill_offset,b"".join(lines))
+            write_at(
+                self.spill_filename + INDEX_SUFFIX,
+                self.spill_lines * OFFSET.itemsize,
+                ends.astype(OFFSET).tobytes(),
+            )
+            self.spill_offset = int(ends[-1])
+            self.spill_lines += count
+        self.spilled += count
+
+    def history(self)->MessageHistory:
+        """Return a reader over every message of this log, including the spilled ones."""
+        return MessageHistory(self)
     
     # Render calls render_messages which is a static method that actually renders the messages to the screen.
     # It renders them in reverse order, to make it appear that the messages are scrolling in an upwards direction.
@@ -50,7 +132,10 @@ class MessageLog:
         Render this log over the given area.
         'x','y','width','height' is the rectangular region to render onto the 'console'
         """
-        self.render_messages(console,x,y,width,height,self.messages)
+        messages = self.recent
+        if self.older is not None and len(messages) < height:
+            messages = self.messages # Not enough recent messages to fill the area.
+        self.render_messages(console,x,y,width,height,messages)
     
     @staticmethod
     def wrap(string:str, width:int)->Iterable[str]:
@@ -59,7 +144,21 @@ class MessageLog:
             yield from textwrap.wrap(
                 line,width,expand_tabs=True,
             )
-            
+
+    @classmethod
+    def wrapped_lines(cls,message:Message,width:int)->Tuple[str,...]:
+        """Return the wrapped lines of `message`, wrapping it only when it wasn't yet."""
+        widths = wrap_cache.get(message)
+        if widths is None:
+            widths = wrap_cache[message] = {}
+        cached = widths.get(width)
+        if cached is None or cached[0] != message.count:
+            metrics.count("cache.wrap.misses")
+            cached = widths[width] = (message.count,tuple(cls.wrap(message.full_text,width)))
+        else:
+            metrics.count("cache.wrap.hits")
+        return cached[1]
+
     @classmethod
     def render_messages(
         cls,
@@ -77,8 +176,67 @@ class MessageLog:
         y_offset = height-1
 
         for message in reversed(messages):
-            for line in reversed(list(cls.wrap(message.full_text,width))):
+            for line in reversed(cls.wrapped_lines(message,width)):
                 console.print(x=x,y=y+y_offset, string = line, fg=message.fg)
                 y_offset -=1
                 if y_offset < 0:
-                    return # No more space to print messages.
\ No newline at end of file
+                    return # No more space to print messages.
+
+
+def write_at(filename:str,offset:int,data:bytes)->None:
+    """Replace whatever `filename` holds from `offset` on with `data`."""
+    mode = "r+b" if os.path.exists(filename) else "wb"
+    with open(filename,mode) as f:
+        f.seek(offset)
+        f.truncate()
+        f.write(data)
+
+
+class MessageHistory:
+    """
+    The whole history of a MessageLog, the spilled messages are read from disk page by page.
+
+    The offsets of the spilled messages are read from the spill file's index when a page
+    needs them, so opening the history doesn't depend on how many messages were spilled.
+    """
+
+    def __init__(self,message_log:MessageLog):
+        self.messages = message_log.messages
+        self.filename = message_log.spill_filename
+        self.spilled = message_log.spill_lines if self.filename is not None else 0
+
+    def line_offsets(self,start:int,stop:int)->Tuple[int,int]:
+        """Return where the spilled message `start` starts and where message `stop - 1` ends."""
+        assert self.filename is not None
+        # The index holds the end of each line, the start of a line is the end of the previous.
+        first = max(start - 1,0)
+        ends = np.fromfile(
+            self.filename + INDEX_SUFFIX,
+            dtype=OFFSET,
+            count=stop - first,
+            offset=first * OFFSET.itemsize,
+        )
+        return (int(ends[0]) if start else 0), int(ends[-1])
+
+    def __len__(self)->int:
+        return self.spilled + len(self.messages)
+
+    def page(self,start:int,stop:int)->List[Message]:
+        """Return the messages from index `start` up to `stop`, the oldest first."""
+        start = max(0,start)
+        stop = min(stop,len(self))
+        page: List[Message] = []
+        if start < self.spilled:
+            assert self.filename is not None
+            begin, end = self.line_offsets(start,min(stop,self.spilled))
+            with open(self.filename,"rb") as f:
+                f.seek(begin)
+                data = f.read(end - begin)
+            for line in data.decode("utf-8").splitlines():
+                text, fg, count = json.loads(line)
+                message = Message(text,tuple(fg))
+                message.count = count
+                page.append(message)
+        if stop > self.spilled:
+            page.extend(self.messages[max(start-self.spilled,0):stop-self.spilled])
+        return page
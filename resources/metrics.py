@@ -0,0 +1,84 @@
+"""
+Counters of what happens in a session: turns, actions by type, impossible actions, paths,
+field of view updates, cache hits and misses, messages logged...
+
+Counting is always on: an increment is a dictionary update, cheap enough for the hot paths.
+Gauges, like the entities alive by type or the hit rates of the caches, are only computed
+when a snapshot is taken. Snapshots are appended as JSON lines to a file, every few turns
+and at exit, once the file is opened:
+
+    python main.py --metrics metrics.jsonl
+    python -m resources.headless --metrics metrics.jsonl --metrics-every 50
+"""
+from __future__ import annotations
+
+import collections
+import json
+import time
+from typing import Any, DefaultDict, Dict, Optional, TextIO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+# Turns between two snapshots written to the metrics file.
+DEFAULT_SNAPSHOT_TURNS = 100
+
+
+class Metrics:
+    """The counters of the session, and the file their snapshots are written to."""
+
+    def __init__(self) -> None:
+        self.counters: DefaultDict[str, int] = collections.defaultdict(int)
+        self.file: Optional[TextIO] = None
+        self.every = DEFAULT_SNAPSHOT_TURNS
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def open(self, filename: str, every: int = DEFAULT_SNAPSHOT_TURNS) -> None:
+        """Append a snapshot to `filename` every `every` turns and when closed."""
+        self.file = open(filename, "a", encoding="utf-8")
+        self.every = every
+
+    def end_turn(self, engine: Engine) -> None:
+        self.counters["turns"] += 1
+        if self.file is not None and engine.turn % self.every == 0:
+            self.write(engine)
+
+    def gauges(self, engine: Optional[Engine]) -> Dict[str, float]:
+        """Values computed from the game and the counters, rather than counted."""
+        gauges: Dict[str, float] = {}
+        for name, hits in list(self.counters.items()):
+            if name.endswith(".hits"):
+                cache = name[: -len(".hits")]
+                gauges[f"{cache}.hit_rate"] = hits / (hits + self.counters[f"{cache}.misses"])
+        if engine is not None:
+            entities = collections.Counter(entity.name for entity in engine.game_map.entities)
+            for name, alive in entities.items():
+                gauges[f"entities.{name}"] = alive
+            gauges["floor"] = engine.game_world.current_floor
+        return gauges
+
+    def snapshot(self, engine: Optional[Engine] = None) -> Dict[str, Any]:
+        return {
+            "time": time.time(),
+            "turn": None if engine is None else engine.turn,
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": dict(sorted(self.gauges(engine).items())),
+        }
+
+    def write(self, engine: Optional[Engine] = None) -> None:
+        assert self.file is not None
+        self.file.write(json.dumps(self.snapshot(engine)) + "\n")
+        self.file.flush()
+
+    def close(self, engine: Optional[Engine] = None) -> None:
+        """Write the last snapshot and close the file, if there is one."""
+        if self.file is None:
+            return
+        self.write(engine)
+        self.file.close()
+        self.file = None
+
+
+metrics = Metrics()
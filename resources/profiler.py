@@ -0,0 +1,269 @@
+"""
+Profiling of the game while it is played.
+
+The turn profiler times the phases of a turn: input dispatch, the player's action, the enemy
+turns, the field of view and the render. It is off by default and each hook then costs a single
+attribute check. Once on, it keeps the last timings of each phase to show their percentiles in
+an overlay (F3), and can write a row per turn to a CSV file (python main.py --profile-csv turns.csv).
+
+The profile capture runs cProfile over the next turns (F4, or the --profile option of
+resources/headless.py) and writes the result to PROFILE_DIRECTORY, both as a pstats file and
+as collapsed stacks for flame graph tools.
+"""
+from __future__ import annotations
+
+import collections
+import contextlib
+import os
+import time
+from typing import (
+    Any, ContextManager, Deque, Dict, Iterator, List, Optional, TextIO, Tuple, TYPE_CHECKING
+)
+
+import numpy as np
+
+from resources import color
+
+# cProfile, csv and pstats are only imported once a profile or a CSV file is asked for,
+# they are not needed to start the game.
+if TYPE_CHECKING:
+    import cProfile
+    import pstats
+
+    from tcod.console import Console
+    from resources.engine import Engine
+
+PHASES = ("input", "perform", "enemies", "fov", "render")
+
+# Shared by every hook while the profiler is off.
+NO_PHASE = contextlib.nullcontext()
+
+
+class PhaseTimer:
+    """Adds the time spent in its `with` block to a phase of the current frame."""
+
+    def __init__(self, profiler: TurnProfiler, phase: str):
+        self.profiler = profiler
+        self.phase = phase
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: object) -> None:
+        current = self.profiler.current
+        current[self.phase] = current.get(self.phase, 0.0) + time.perf_counter() - self.start
+
+
+class TurnProfiler:
+    def __init__(self, history: int = 500):
+        self.enabled = False
+        self.overlay = False
+        # The last `history` timings of each phase, in seconds.
+        self.samples: Dict[str, Deque[float]] = {
+            phase: collections.deque(maxlen=history) for phase in PHASES
+        }
+        self.current: Dict[str, float] = {} # Phases timed during the current frame.
+        self.turn: Optional[int] = None # The turn which ended during the current frame.
+        self.csv_file: Optional[TextIO] = None
+        self.csv_writer: Optional[Any] = None
+
+    def phase(self, name: str) -> ContextManager[None]:
+        """Return a context manager timing its block as part of the phase `name`."""
+        if not self.enabled:
+            return NO_PHASE
+        return PhaseTimer(self, name)
+
+    def toggle_overlay(self) -> None:
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.csv_file is not None
+
+    def open_csv(self, filename: str) -> None:
+        """Write the timings of every turn to `filename`, in milliseconds."""
+        import csv
+
+        self.csv_file = open(filename, "w", newline="", encoding="utf-8")
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(("turn", *PHASES))
+        self.enabled = True
+
+    def close(self) -> None:
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = self.csv_writer = None
+        self.enabled = self.overlay
+
+    def end_turn(self, turn: int) -> None:
+        """Called when a turn ends, its timings are written once its frame is rendered."""
+        if self.enabled:
+            self.turn = turn
+
+    def end_frame(self) -> None:
+        """Store the timings of the frame which was just presented."""
+        if not self.enabled:
+            return
+        for phase, duration in self.current.items():
+            self.samples[phase].append(duration)
+        if self.turn is not None and self.csv_writer is not None:
+            self.csv_writer.writerow(
+                (self.turn, *(f"{self.current.get(phase, 0.0) * 1000:.3f}" for phase in PHASES))
+            )
+        self.current = {}
+        self.turn = None
+
+    def percentiles(self, phase: str) -> Optional[Tuple[float, float, float]]:
+        """Return the p50, p95 and max of `phase` in milliseconds, if it was timed."""
+        samples = self.samples[phase]
+        if not samples:
+            return None
+        array = np.array(samples) * 1000
+        p50, p95 = np.percentile(array, (50, 95))
+        return float(p50), float(p95), float(array.max())
+
+    def render(self, console: Console) -> None:
+        """Draw the timings of each phase in the top right corner."""
+        width = 36
+        x = console.width - width
+        console.draw_frame(
+            x=x, y=0, width=width, height=len(PHASES) + 3, title="Turn profile (ms)",
+            clear=True, fg=color.white, bg=color.black,
+        )
+        console.print(x + 1, 1, f"{'phase':<8}{'p50':>8}{'p95':>8}{'max':>8}")
+        for i, phase in enumerate(PHASES):
+            stats = self.percentiles(phase)
+            if stats is None:
+                text = f"{phase:<8}{'-':>8}{'-':>8}{'-':>8}"
+            else:
+                text = f"{phase:<8}" + "".join(f"{value:>8.2f}" for value in stats)
+            console.print(x + 1, 2 + i, text)
+
+
+turn_profiler = TurnProfiler()
+
+
+PROFILE_DIRECTORY = "profiles"
+# Turns profiled by the F4 key.
+DEFAULT_PROFILE_TURNS = 100
+
+Function = Tuple[str, int, str] # How pstats names a function: file, line and name.
+
+
+def frame_name(function: Function) -> str:
+    filename, line, name = function
+    if filename == "~": # Built in functions.
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapse_stacks(stats: pstats.Stats, threshold: float = 1e-6) -> Iterator[str]:
+    """
+    Yield the profile as collapsed stacks, "root;caller;function microseconds" per line.
+
+    cProfile only records who called each function, not whole stacks, so the time of a
+    function is split between its callers in proportion of the time spent under each of them.
+    Recursive calls are cut at their first repetition.
+    """
+    entries: Dict[Function, Any] = stats.stats # type: ignore[attr-defined]
+    callees: Dict[Function, Dict[Function, float]] = collections.defaultdict(dict)
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees[caller][function] = edge[3]
+    roots = [
+        function for function, entry in entries.items()
+        if not any(caller in entries for caller in entry[4])
+    ]
+
+    totals: Dict[Tuple[str, ...], float] = collections.defaultdict(float)
+
+    def walk(function: Function, share: float, path: Tuple[str, ...]) -> None:
+        """Add the time of `function` under `path`, `share` being the part of its time it gets."""
+        _, _, own_time, total_time, _ = entries[function]
+        path = path + (frame_name(function),)
+        totals[path] += own_time * share
+        if len(path) >= 64:
+            return
+        for callee, edge_time in callees[function].items():
+            callee_total = entries[callee][3]
+            if callee_total <= 0 or frame_name(callee) in path:
+                continue
+            callee_share = edge_time * share / callee_total
+            if edge_time * share >= threshold:
+                walk(callee, callee_share, path)
+
+    for root in roots:
+        walk(root, 1.0, ())
+    for path, seconds in totals.items():
+        microseconds = round(seconds * 1_000_000)
+        if microseconds > 0:
+            yield f"{';'.join(path)} {microseconds}"
+
+
+class ProfileCapture:
+    """Runs cProfile for a number of turns, then writes what it found."""
+
+    def __init__(self) -> None:
+        self.profile: Optional[cProfile.Profile] = None
+        self.turns_left = 0
+        self.turns_profiled = 0
+        self.start_turn = 0
+        self.start_floor = 0
+        self.written: List[str] = [] # Files written by the last capture.
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def start(self, engine: Engine, turns: int = DEFAULT_PROFILE_TURNS) -> None:
+        if self.running:
+            return
+        self.turns_left = turns
+        self.turns_profiled = 0
+        self.start_turn = engine.turn
+        self.start_floor = engine.game_world.current_floor
+        engine.message_log.add_message(f"Profiling the next {turns} turns.", color.white)
+        import cProfile
+
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def end_turn(self, engine: Engine) -> None:
+        if self.profile is None:
+            return
+        self.turns_left -= 1
+        self.turns_profiled += 1
+        if self.turns_left <= 0:
+            self.stop(engine)
+
+    def tag(self, engine: Engine) -> str:
+        """Describe what was profiled: the floors and turns, the entities and the map size."""
+        game_map = engine.game_map
+        floor = engine.game_world.current_floor
+        floors = f"{self.start_floor}" if floor == self.start_floor else f"{self.start_floor}-{floor}"
+        return (
+            f"floor{floors}_turn{self.start_turn}+{self.turns_profiled}"
+            f"_entities{len(game_map.entities)}_actors{len(list(game_map.actors))}"
+            f"_items{len(list(game_map.items))}_map{game_map.width}x{game_map.height}"
+        )
+
+    def stop(self, engine: Engine) -> None:
+        """Stop profiling and write the pstats and collapsed stacks files."""
+        if self.profile is None:
+            return
+        import pstats
+
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+
+        os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+        base = os.path.join(PROFILE_DIRECTORY, f"{time.strftime('%Y%m%d-%H%M%S')}_{self.tag(engine)}")
+        stats = pstats.Stats(profile)
+        stats.dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+            for line in collapse_stacks(stats):
+                f.write(line + "\n")
+
+        self.written = [f"{base}.pstats", f"{base}.collapsed"]
+        engine.message_log.add_message(f"Profile written to {base}.pstats", color.white)
+
+
+profile_capture = ProfileCapture()
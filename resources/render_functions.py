@@ -21,19 +21,20 @@ def get_names_at_location(x: int, y:int, game_map:GameMap)->str:
 
 # Adding the render of the Health Points bar.
 def render_bar(
-        console: Console,current_value:int, maximum_value:int, total_width:int
+        console: Console,current_value:int, maximum_value:int, total_width:int,
+        x:int = 0, y:int = 45,
 )-> None:
     bar_width = int(float(current_value)/maximum_value*total_width)
 
-    console.draw_rect(x=0,y=45,width = total_width, height = 1, ch = 1,bg=color.bar_empty)
+    console.draw_rect(x=x,y=y,width = total_width, height = 1, ch = 1,bg=color.bar_empty)
 
     if bar_width>0:
         console.draw_rect(
-            x = 0, y = 45, width = bar_width, height = 1, ch = 1, bg = color.bar_filled
+            x = x, y = y, width = bar_width, height = 1, ch = 1, bg = color.bar_filled
         )
     
     console.print(
-        x = 1, y = 45, string = f"HP: {current_value}/{maximum_value}",fg=color.bar_text
+        x = x+1, y = y, string = f"HP: {current_value}/{maximum_value}",fg=color.bar_text
     )
 
 def render_dungeon_level(
@@ -62,4 +63,4 @@ def render_names_at_mouse_location(
         x = mouse_x, y = mouse_y, game_map=engine.game_map
     )
 
-    console.print(x==x, y=y, string = names_at_mouse_location)
\ No newline at end of file
+    console.print(x=x, y=y, string = names_at_mouse_location)
\ No newline at end of file
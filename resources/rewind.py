@@ -0,0 +1,49 @@
+"""Keep the last turns of a session in memory so they can be stepped back through."""
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Tuple, TYPE_CHECKING
+
+from resources.snapshot import EngineSnapshot
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+
+class TurnHistory:
+    """
+    A ring buffer with a snapshot of the Engine at the end of each of the last turns.
+
+    Every snapshot shares the records and arrays that didn't change with the one before it,
+    so the memory used grows with what actually changed each turn, not with the map size.
+    """
+
+    def __init__(self, capacity: int):
+        # One more slot than the turns we can go back, the last one holds the current turn.
+        self.snapshots: Deque[Tuple[int, EngineSnapshot]] = deque(maxlen=capacity + 1)
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    @property
+    def turns(self) -> Tuple[int, ...]:
+        """The turn numbers that can be restored, oldest first."""
+        return tuple(turn for turn, _ in self.snapshots)
+
+    def record(self, engine: Engine) -> None:
+        """Store the state of `engine` at the end of its current turn."""
+        previous = self.snapshots[-1][1] if self.snapshots else None
+        self.snapshots.append((engine.turn, EngineSnapshot(engine, previous)))
+
+    def rewind(self, engine: Engine, turns: int = 1) -> bool:
+        """
+        Go back `turns` turns, restoring `engine` in place.
+
+        The turns rewound over are forgotten. Returns False if they aren't in the history.
+        """
+        if turns < 1 or turns >= len(self.snapshots):
+            return False
+        for _ in range(turns):
+            self.snapshots.pop()
+        self.snapshots[-1][1].restore(engine)
+        return True
@@ -0,0 +1,212 @@
+"""
+A history of the finished runs in a SQLite database: seed, depth reached, cause of death,
+turns, items used...
+
+The game records a run when the player dies (see input_handlers.record_run). The headless
+runner records each of its games with the source "bot", and inserts them in batches of
+BATCH_SIZE runs per transaction. Nothing is recorded until the store is opened, so benchmarks and tools
+playing games don't mix their runs with the player's.
+
+The indexes cover the aggregates below, so they stay fast with millions of runs:
+
+    python -m resources.run_history summary
+    python -m resources.run_history depth             # Median depth by version and source.
+    python -m resources.run_history deaths --source player
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from resources.save_slots import SAVE_DIRECTORY
+
+if TYPE_CHECKING:
+    import sqlite3
+
+    from resources.engine import Engine
+
+# Recorded with every run. Change it along with anything that changes the odds of a run, so
+# the runs before and after can be compared.
+VERSION = "1.0"
+
+DEFAULT_FILENAME = os.path.join(SAVE_DIRECTORY, "runs.sqlite3")
+# Runs inserted per transaction by the headless runner.
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    version TEXT NOT NULL,
+    source TEXT NOT NULL,
+    seed INTEGER,
+    ended REAL NOT NULL,
+    depth INTEGER NOT NULL,
+    turns INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    cause TEXT,
+    items_used INTEGER NOT NULL
+);
+-- Sorted by depth in each group for the medians, the other columns make it cover the summary.
+CREATE INDEX IF NOT EXISTS runs_by_version
+    ON runs (version, source, depth, turns, items_used, cause);
+CREATE INDEX IF NOT EXISTS runs_by_cause ON runs (cause, depth, source);
+"""
+
+COLUMNS = ("version", "source", "seed", "ended", "depth", "turns", "level", "cause", "items_used")
+INSERT = f"INSERT INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+Run = Tuple[str, str, Optional[int], float, int, int, int, Optional[str], int]
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    import sqlite3 # Only when a run is recorded or read, it's not needed to start the game.
+
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(filename)
+    # The game and a headless runner may write at the same time.
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class RunStore:
+    """The runs waiting to be inserted, and the database they go to."""
+
+    def __init__(self) -> None:
+        self.filename: Optional[str] = None
+        self.source = "player"
+        self.batch_size = 1
+        self.pending: List[Run] = []
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def open(self, filename: str, source: str = "player", batch_size: int = 1) -> None:
+        """
+        Record the runs in `filename`. By default each run is inserted right away. The database
+        is only connected to when the first run is inserted.
+        """
+        self.filename = filename
+        self.source = source
+        self.batch_size = batch_size
+
+    def add(self, engine: Engine, cause: Optional[str]) -> None:
+        """Record the run played in `engine`. `cause` is what killed the player, if it died."""
+        if self.filename is None:
+            return
+        self.pending.append((
+            VERSION,
+            self.source,
+            engine.seed,
+            time.time(),
+            engine.game_world.current_floor,
+            engine.turn,
+            engine.player.level.current_level,
+            cause,
+            engine.items_used,
+        ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Insert the pending runs in a single transaction."""
+        if not self.pending or self.filename is None:
+            return
+        try:
+            if self.connection is None:
+                self.connection = connect(self.filename)
+            with self.connection:
+                self.connection.executemany(INSERT, self.pending)
+        finally:
+            # Runs which couldn't be inserted are dropped, not tried again with every run.
+            self.pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.filename = None
+
+
+run_store = RunStore()
+
+
+def median_depths(connection: sqlite3.Connection) -> List[Tuple[str, str, int, int]]:
+    """Return the version, source, number of runs and median depth of each group of runs."""
+    groups = connection.execute(
+        "SELECT version, source, COUNT(*) FROM runs GROUP BY version, source"
+    ).fetchall()
+    rows = []
+    for version, source, count in groups:
+        # The index is sorted by depth within each group, so this only walks half the group.
+        (median,) = connection.execute(
+            "SELECT depth FROM runs WHERE version = ? AND source = ? "
+            "ORDER BY depth LIMIT 1 OFFSET ?",
+            (version, source, count // 2),
+        ).fetchone()
+        rows.append((version, source, count, median))
+    return rows
+
+
+def deaths(
+        connection: sqlite3.Connection, source: Optional[str] = None,
+) -> List[Tuple[str, int, int]]:
+    """Return how many runs each monster ended on each floor, the deadliest first."""
+    query = "SELECT cause, depth, COUNT(*) FROM runs WHERE cause IS NOT NULL"
+    parameters: tuple = ()
+    if source is not None:
+        query += " AND source = ?"
+        parameters = (source,)
+    query += " GROUP BY cause, depth ORDER BY depth, COUNT(*) DESC"
+    return connection.execute(query, parameters).fetchall()
+
+
+def summary(connection: sqlite3.Connection) -> List[tuple]:
+    """Return the number of runs and their averages, by version and source."""
+    return connection.execute(
+        "SELECT version, source, COUNT(*), AVG(depth), MAX(depth), AVG(turns), AVG(items_used), "
+        "SUM(cause IS NOT NULL) FROM runs GROUP BY version, source ORDER BY version, source"
+    ).fetchall()
+
+
+def print_table(header: Tuple[str, ...], rows: List[tuple]) -> None:
+    def cell(value: object) -> str:
+        return f"{value:.1f}" if isinstance(value, float) else str(value)
+
+    lines = [tuple(header)] + [tuple(cell(value) for value in row) for row in rows]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    for line in lines:
+        print("  ".join(text.rjust(width) for text, width in zip(line, widths)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Aggregate the history of finished runs.")
+    parser.add_argument("query", choices=("summary", "depth", "deaths"))
+    parser.add_argument("--db", default=DEFAULT_FILENAME, help="The runs database.")
+    parser.add_argument("--source", help="Only the runs of this source, for deaths.")
+    arguments = parser.parse_args()
+
+    if not os.path.exists(arguments.db):
+        parser.error(f"{arguments.db} doesn't exist, no run was recorded yet.")
+    connection = connect(arguments.db)
+    start = time.perf_counter()
+    if arguments.query == "summary":
+        rows = summary(connection)
+        header = ("version", "source", "runs", "depth", "max", "turns", "items", "deaths")
+    elif arguments.query == "depth":
+        rows = median_depths(connection)
+        header = ("version", "source", "runs", "median depth")
+    else:
+        rows = deaths(connection, arguments.source)
+        header = ("killed by", "floor", "deaths")
+    elapsed = time.perf_counter() - start
+    print_table(header, rows)
+    print(f"({elapsed * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
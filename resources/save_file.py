@@ -0,0 +1,154 @@
+"""
+The save file format.
+
+A save is split in sections which are compressed separately, so loading only has to decode
+what is needed to show and play the current floor. Bulky parts, like the older messages,
+are decoded the first time they are used.
+
+    MAGIC | table size (4 bytes) | table (JSON: section name -> size) | sections...
+"""
+from __future__ import annotations
+
+import copy
+import copyreg
+import io
+import json
+import lzma
+import pickle
+import struct
+from typing import Any, Dict, Generator, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+MAGIC = b"TATOSAV\x02"
+
+# How many of the last messages are loaded along with the game, enough to draw the log.
+RECENT_MESSAGES = 50
+
+# Bytes compressed per step when a save is made in the background, at most a few milliseconds.
+COMPRESS_STEP = 8 * 1024
+
+
+class LazySection:
+    """A compressed section of a save, decoded when `load` is called."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def load(self) -> Any:
+        return pickle.loads(lzma.decompress(self.data))
+
+
+def write(filename: str, sections: Dict[str, bytes]) -> None:
+    table = json.dumps({name: len(data) for name, data in sections.items()}).encode()
+    with open(filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(table)))
+        f.write(table)
+        for data in sections.values():
+            f.write(data)
+
+
+def is_sectioned(data: bytes) -> bool:
+    """Return False for saves written before sections existed (a single compressed pickle)."""
+    return data.startswith(MAGIC)
+
+
+def read(data: bytes) -> Dict[str, LazySection]:
+    """Split the contents of a save file in its sections, without decoding any of them."""
+    offset = len(MAGIC)
+    (table_size,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    table = json.loads(data[offset : offset + table_size])
+    offset += table_size
+
+    sections = {}
+    for name, size in table.items():
+        sections[name] = LazySection(data[offset : offset + size])
+        offset += size
+    return sections
+
+
+def reduce_engine(engine: Engine) -> tuple:
+    """Pickle an Engine without its message log, which is saved in its own section."""
+    state = engine.__getstate__()
+    del state["message_log"]
+    return copyreg.__newobj__, (type(engine),), state
+
+
+def dump_core(engine: Engine) -> bytes:
+    """Pickle `engine` without its message log."""
+    core = io.BytesIO()
+    pickler = pickle.Pickler(core, pickle.HIGHEST_PROTOCOL)
+    # Only the Engine is looked up in this table, unlike a persistent_id callback which
+    # would run for every object pickled.
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[type(engine)] = reduce_engine
+    pickler.dump(engine)
+    return core.getvalue()
+
+
+def pickle_engine(engine: Engine) -> Dict[str, Tuple[bytes, bool]]:
+    """
+    Return the sections of a save of `engine`, each with whether it still has to be
+    compressed. Only this step reads the game, compressing can happen after it moved on.
+    """
+    message_log = engine.message_log
+    recent_log = copy.copy(message_log)
+    if message_log.older is not None:
+        # The older messages loaded with the game were never decoded, they are written back
+        # as they were, along with every message since.
+        older_messages = (message_log.older.data, False)
+        recent_log.older = None
+    else:
+        recent_log.recent = message_log.recent[-RECENT_MESSAGES:]
+        older_messages = (
+            pickle.dumps(message_log.recent[:-RECENT_MESSAGES], pickle.HIGHEST_PROTOCOL), True
+        )
+
+    return {
+        "core": (dump_core(engine), True),
+        "message_log": (pickle.dumps(recent_log, pickle.HIGHEST_PROTOCOL), True),
+        "older_messages": older_messages,
+    }
+
+
+def dump_engine(engine: Engine) -> Dict[str, bytes]:
+    """Return the sections of a save of `engine`."""
+    return {
+        name: lzma.compress(data) if pending else data
+        for name, (data, pending) in pickle_engine(engine).items()
+    }
+
+
+def compress_steps(
+        pickled: Dict[str, Tuple[bytes, bool]],
+) -> Generator[None, None, Dict[str, bytes]]:
+    """
+    Compress the sections given by `pickle_engine` COMPRESS_STEP bytes at a time, yielding
+    before each step, and return them. It's a frame_clock.Job, see save_slots.autosave.
+    """
+    sections = {}
+    for name, (data, pending) in pickled.items():
+        if pending:
+            compressor = lzma.LZMACompressor()
+            parts = []
+            for start in range(0, len(data), COMPRESS_STEP):
+                yield
+                parts.append(compressor.compress(data[start : start + COMPRESS_STEP]))
+            yield
+            parts.append(compressor.flush())
+            data = b"".join(parts)
+        sections[name] = data
+    return sections
+
+
+def load_engine(sections: Dict[str, LazySection]) -> Engine:
+    """Rebuild an Engine from its sections, leaving the older messages for later."""
+    message_log = sections["message_log"].load()
+    message_log.older = sections["older_messages"]
+
+    engine = sections["core"].load()
+    engine.message_log = message_log
+    return engine
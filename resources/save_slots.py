@@ -0,0 +1,366 @@
+"""Save slots, and a small index describing each of them so menus never have to load a save."""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from resources.frame_clock import Job, jobs
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+SAVE_DIRECTORY = "saves"
+INDEX_FILENAME = os.path.join(SAVE_DIRECTORY, "index.json")
+LEGACY_SAVE_FILENAME = "savegame.sav"  # The single save file used before slots existed.
+
+SLOTS = (1, 2, 3)
+
+# The minimap stored in every header is at most this many characters wide and tall.
+THUMBNAIL_WIDTH = 20
+THUMBNAIL_HEIGHT = 10
+
+
+class SaveHeader:
+    """What the menus need to know about a save, without loading the game itself."""
+
+    def __init__(
+            self,
+            *,
+            slot: int,
+            floor: int,
+            level: int,
+            hp: int,
+            max_hp: int,
+            turn: int,
+            timestamp: float,
+            thumbnail: List[str],
+    ):
+        self.slot = slot
+        self.floor = floor
+        self.level = level
+        self.hp = hp
+        self.max_hp = max_hp
+        self.turn = turn
+        self.timestamp = timestamp
+        self.thumbnail = thumbnail
+
+    @classmethod
+    def from_engine(cls, engine: Engine, slot: int) -> SaveHeader:
+        player = engine.player
+        return cls(
+            slot=slot,
+            floor=engine.game_world.current_floor,
+            level=player.level.current_level,
+            hp=player.fighter.hp,
+            max_hp=player.fighter.max_hp,
+            turn=engine.turn,
+            timestamp=time.time(),
+            thumbnail=make_thumbnail(engine),
+        )
+
+    @property
+    def summary(self) -> str:
+        """One line describing this save."""
+        saved_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.timestamp))
+        return (
+            f"Floor {self.floor}, Lv {self.level}, HP {self.hp}/{self.max_hp}, "
+            f"Turn {self.turn} - {saved_at}"
+        )
+
+    def to_json(self) -> dict:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_json(cls, data: dict) -> SaveHeader:
+        return cls(**data)
+
+
+def make_thumbnail(engine: Engine) -> List[str]:
+    """
+    Return a low resolution picture of what the player explored on the current floor.
+
+    Each character covers a block of tiles: '@' the player, '>' the stairs, '.' a walkable
+    tile, '#' only walls and ' ' when nothing of the block was explored.
+    """
+    game_map = engine.game_map
+    block_width = math.ceil(game_map.width / THUMBNAIL_WIDTH)
+    block_height = math.ceil(game_map.height / THUMBNAIL_HEIGHT)
+    width = math.ceil(game_map.width / block_width)
+    height = math.ceil(game_map.height / block_height)
+
+    def blocks(array: np.ndarray) -> np.ndarray:
+        """Return for each block whether any of its tiles is set in `array`."""
+        padded = np.zeros((width * block_width, height * block_height), dtype=bool)
+        padded[: game_map.width, : game_map.height] = array
+        return padded.reshape(width, block_width, height, block_height).any(axis=(1, 3))
+
+    explored = blocks(game_map.explored)
+    walkable = blocks(game_map.explored & game_map.tiles["walkable"])
+
+    cells = np.where(walkable, ".", np.where(explored, "#", " "))
+    stairs_x, stairs_y = game_map.down_stairs_location
+    if game_map.explored[stairs_x, stairs_y]:
+        cells[stairs_x // block_width, stairs_y // block_height] = ">"
+    cells[engine.player.x // block_width, engine.player.y // block_height] = "@"
+
+    # The arrays are indexed [x, y], rows of text go along y.
+    return ["".join(row) for row in cells.T]
+
+
+def slot_filename(slot: int) -> str:
+    return os.path.join(SAVE_DIRECTORY, f"slot{slot}.sav")
+
+
+def log_filename(slot: int) -> str:
+    """The file the older messages of the game in `slot` are spilled to."""
+    return os.path.join(SAVE_DIRECTORY, f"slot{slot}.log")
+
+
+def spill_files(filename: str) -> Tuple[str, str]:
+    """Return the spill file `filename` and its index, see MessageLog.spill."""
+    from resources.message_log import INDEX_SUFFIX
+
+    return filename, filename + INDEX_SUFFIX
+
+
+def assign_slot(engine: Engine, slot: int) -> None:
+    """Make `engine` save to `slot` and spill its older messages next to that save."""
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    engine.save_slot = slot
+    engine.message_log.spill_filename = log_filename(slot)
+
+
+# A new game only takes a slot when it's saved for the first time, so starting a game never
+# touches the saves of the others. Until then its older messages go to a file of its own.
+def start_session(engine: Engine, replace_slot: Optional[int] = None) -> None:
+    """
+    Make the new game in `engine` spill its older messages to a private file. When every slot
+    is used, the game may only take `replace_slot`, the one the player agreed to replace.
+    """
+    import tempfile # Slow to import, and only needed once a game starts.
+
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    descriptor, filename = tempfile.mkstemp(prefix="session-", suffix=".log", dir=SAVE_DIRECTORY)
+    os.close(descriptor)
+    engine.save_slot = None
+    engine.replace_slot = replace_slot
+    engine.message_log.spill_filename = filename
+
+
+def claim_slot(engine: Engine) -> Optional[int]:
+    """
+    Give a game saved for the first time a slot: the first free one, or else the one the
+    player agreed to replace when the game started. Its spilled messages are moved next to
+    that save. Returns None, leaving every save alone, when there is no such slot.
+    """
+    slot = free_slot()
+    if slot is None:
+        slot = engine.replace_slot
+    if slot is None:
+        return None
+    spill_filename = engine.message_log.spill_filename
+    sources = spill_files(spill_filename) if spill_filename is not None else (None, None)
+    for source, destination in zip(sources, spill_files(log_filename(slot))):
+        if source is not None and os.path.exists(source):
+            os.replace(source, destination)
+        elif os.path.exists(destination): # Left by the save being replaced.
+            os.remove(destination)
+    assign_slot(engine, slot)
+    engine.replace_slot = None
+    return slot
+
+
+def oldest_slot() -> Optional[int]:
+    """Return the slot saved first, the one offered for a new game when every slot is used."""
+    headers = read_index()
+    if not headers:
+        return None
+    return min(headers.values(), key=lambda header: header.timestamp).slot
+
+
+def read_index() -> Dict[int, SaveHeader]:
+    """Return the header of every used slot."""
+    try:
+        with open(INDEX_FILENAME, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {int(slot): SaveHeader.from_json(header) for slot, header in data.items()}
+
+
+def write_index(headers: Dict[int, SaveHeader]) -> None:
+    """Replace the index. The file is swapped at once so a crash never leaves half of it."""
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    temporary_filename = f"{INDEX_FILENAME}.tmp"
+    with open(temporary_filename, "w", encoding="utf-8") as f:
+        json.dump({slot: header.to_json() for slot, header in headers.items()}, f)
+    os.replace(temporary_filename, INDEX_FILENAME)
+
+
+def free_slot() -> Optional[int]:
+    """Return the first unused slot, or None when every slot holds a save."""
+    headers = read_index()
+    for slot in SLOTS:
+        if slot not in headers:
+            return slot
+    return None
+
+
+def save(engine: Engine) -> Optional[int]:
+    """
+    Save the game in its slot, claiming one if it's its first save. Returns the slot, or None
+    when the game isn't saved: it's never saved, or it has no slot it may take.
+    """
+    if not engine.savable:
+        return None
+    if engine.save_slot is None and claim_slot(engine) is None:
+        return None
+    assert engine.save_slot is not None
+    save_to_slot(engine, engine.save_slot)
+    return engine.save_slot
+
+
+def save_to_slot(engine: Engine, slot: int) -> None:
+    """Save the game in `slot` and update its header."""
+    from resources import save_file
+
+    write_slot(slot, save_file.dump_engine(engine), SaveHeader.from_engine(engine, slot))
+
+
+def write_slot(slot: int, sections: Dict[str, bytes], header: SaveHeader) -> None:
+    """Write the save made of `sections` in `slot`, then its header."""
+    from resources import save_file
+
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    save_file.write(slot_filename(slot), sections)
+
+    headers = read_index()
+    headers[slot] = header
+    write_index(headers)
+
+
+# Autosaves are pickled at the end of a turn, that part has to see the game as it is, but
+# compressed and written in the background by a frame_clock job, so they don't stall a frame.
+def autosave_job(engine: Engine) -> Job:
+    """Return a job saving the game as it is now."""
+    from resources import save_file
+
+    header = SaveHeader.from_engine(engine, slot=0) # The slot is known once it's written.
+    pickled = save_file.pickle_engine(engine)
+    sections = yield from save_file.compress_steps(pickled)
+
+    # Things may have changed while it was compressed.
+    if not engine.player.is_alive:
+        return # The game is over, its save is gone or going.
+    if engine.save_slot is None and claim_slot(engine) is None:
+        return # Every slot is used, and the player didn't agree to replace one.
+    assert engine.save_slot is not None
+    saved = read_index().get(engine.save_slot)
+    if saved is not None and saved.timestamp > header.timestamp:
+        return # Saved again meanwhile.
+    header.slot = engine.save_slot
+    write_slot(engine.save_slot, sections, header)
+
+
+class Autosave:
+    """Saves the game every `every` turns, when it's turned on. See `autosave_job`."""
+
+    def __init__(self) -> None:
+        self.every = 0
+
+    def end_turn(self, engine: Engine) -> None:
+        if self.every and engine.savable and engine.turn % self.every == 0:
+            jobs.add(autosave_job(engine))
+
+
+autosave = Autosave()
+
+
+def load_slot(slot: int) -> Engine:
+    """Load the game saved in `slot`."""
+    from resources.setup_game import load_game
+
+    engine = load_game(slot_filename(slot))
+    assign_slot(engine, slot)
+    return engine
+
+
+class SaveLoader:
+    """
+    Load the game saved in a slot on a worker thread, so the window keeps responding meanwhile.
+
+    Once `done`, either `engine` holds the loaded game or `error` the reason it couldn't load.
+    """
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.engine: Optional[Engine] = None
+        self.error: Optional[Exception] = None
+        self.thread = threading.Thread(target=self.run, name=f"load slot {slot}", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        try:
+            self.engine = load_slot(self.slot)
+        except Exception as exc:
+            traceback.print_exc() # Print to stderr
+            self.error = exc
+
+    @property
+    def done(self) -> bool:
+        return not self.thread.is_alive()
+
+
+def latest_slot(headers: Dict[int, SaveHeader]) -> Optional[int]:
+    """Return the slot saved last, the one most likely to be continued."""
+    if not headers:
+        return None
+    return max(headers.values(), key=lambda header: header.timestamp).slot
+
+
+def delete_slot(slot: int) -> None:
+    """Remove the save in `slot` and its header."""
+    for filename in (slot_filename(slot), *spill_files(log_filename(slot))):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    headers = read_index()
+    if headers.pop(slot, None) is not None:
+        write_index(headers)
+
+
+def discard_game(engine: Engine) -> None:
+    """
+    Remove what a finished game left on disk: the save in its slot, if it has one, or else
+    its private file of spilled messages. The saves of the other games are left alone.
+    """
+    if engine.save_slot is not None:
+        delete_slot(engine.save_slot)
+        return
+    spill_filename = engine.message_log.spill_filename
+    if spill_filename is None:
+        return
+    for filename in spill_files(spill_filename):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def migrate_legacy_save() -> Optional[int]:
+    """Move the old single save file into a slot. Returns the slot used, if any."""
+    if not os.path.exists(LEGACY_SAVE_FILENAME):
+        return None
+    from resources.setup_game import load_game
+
+    engine = load_game(LEGACY_SAVE_FILENAME)
+    engine.save_slot = None # Saved before slots existed.
+    slot = save(engine)
+    if slot is not None: # Otherwise it's kept until a slot is free.
+        os.remove(LEGACY_SAVE_FILENAME)
+    return slot
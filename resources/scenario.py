@@ -0,0 +1,245 @@
+"""
+Stress scenarios: floors much bigger and more crowded than the game makes, to find out how
+the FOV, the AI, rendering and saving scale.
+
+A scenario is written as a size followed by options, all separated by commas:
+
+    2000x2000,actors=5000,items=2000,corpses=1000,player=1000x1000,rooms=20000,layout=open
+
+actors, items and corpses are spread over the free floor tiles. The player starts at
+`player`, or in the first room. `rooms` defaults to as many as the game fits in the same
+area, and the `open` layout is a single room as big as the map. Both the game and the
+headless runner take a scenario:
+
+    python main.py --scenario 500x500,actors=2000
+    python -m resources.headless --scenario 2000x2000,actors=5000 --turns 200
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from resources import color
+from resources import entity_factories
+from resources import tile_types
+from resources.procgen import RectangularRoom
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+    from resources.game_map import GameMap
+
+LAYOUTS = ("rooms", "open")
+
+# The game fits up to 30 rooms in its 80x43 map.
+ROOMS_PER_TILE = 30 / (80 * 43)
+ROOM_MIN_SIZE = 6
+ROOM_MAX_SIZE = 10
+
+# Rooms are linked in the order of a sweep over bands of this height, so each tunnel goes
+# to a room nearby instead of across the map.
+BAND_HEIGHT = 20
+
+ACTORS = [entity_factories.orc, entity_factories.troll]
+ITEMS = [
+    entity_factories.health_potion,
+    entity_factories.confusion_scroll,
+    entity_factories.lightning_scroll,
+    entity_factories.fireball_scroll,
+    entity_factories.dagger,
+    entity_factories.sword,
+    entity_factories.leather_armor,
+    entity_factories.chain_mail,
+]
+
+
+class Scenario:
+    """The settings of a stress floor. `build` makes a game starting on it."""
+
+    def __init__(
+            self,
+            width: int,
+            height: int,
+            *,
+            actors: int = 0,
+            items: int = 0,
+            corpses: int = 0,
+            player: Optional[Tuple[int, int]] = None,
+            rooms: Optional[int] = None,
+            layout: str = "rooms",
+    ):
+        if width < ROOM_MAX_SIZE + 2 or height < ROOM_MAX_SIZE + 2:
+            raise ValueError(f"The map must be at least {ROOM_MAX_SIZE + 2} tiles wide and tall.")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {layout!r}, use one of {', '.join(LAYOUTS)}.")
+        if rooms is not None and rooms < 1:
+            raise ValueError("A scenario needs at least one room.")
+        if player is not None and not (0 < player[0] < width - 1 and 0 < player[1] < height - 1):
+            raise ValueError(f"The player must be inside the map's walls, not at {player}.")
+        self.width = width
+        self.height = height
+        self.actors = actors
+        self.items = items
+        self.corpses = corpses
+        self.player = player
+        self.rooms = max(1, round(width * height * ROOMS_PER_TILE)) if rooms is None else rooms
+        self.layout = layout
+
+    @classmethod
+    def parse(cls, text: str) -> Scenario:
+        """Read a scenario written like `2000x2000,actors=5000,player=10x10`."""
+        size, *options = text.split(",")
+        width, height = parse_pair(size)
+        settings: dict = {}
+        for option in options:
+            name, _, value = option.partition("=")
+            name = name.strip()
+            if name in ("actors", "items", "corpses", "rooms"):
+                settings[name] = int(value)
+            elif name == "player":
+                settings[name] = parse_pair(value)
+            elif name == "layout":
+                settings[name] = value.strip()
+            else:
+                raise ValueError(f"Unknown scenario option {name!r}.")
+        return cls(width, height, **settings)
+
+    def __str__(self) -> str:
+        text = (
+            f"{self.width}x{self.height},actors={self.actors},items={self.items},"
+            f"corpses={self.corpses},rooms={self.rooms},layout={self.layout}"
+        )
+        if self.player is not None:
+            text += f",player={self.player[0]}x{self.player[1]}"
+        return text
+
+    def build(self, seed: int = 0) -> Engine:
+        """Return a new game whose first floor is this scenario."""
+        from resources.engine import Engine
+        from resources.game_map import GameMap, GameWorld
+        from resources.setup_game import equip_starting_gear
+
+        random.seed(seed)
+        player = copy.deepcopy(entity_factories.player)
+        engine = Engine(player=player)
+        engine.seed = seed
+        engine.savable = False # Saving a huge floor takes seconds, and would take a player's slot.
+        # The next floors are made by the game's generator, with the scenario's size.
+        engine.game_world = GameWorld(
+            engine=engine,
+            map_width=self.width,
+            map_height=self.height,
+            max_rooms=self.rooms,
+            room_min_size=ROOM_MIN_SIZE,
+            room_max_size=ROOM_MAX_SIZE,
+            current_floor=1,
+        )
+        game_map = engine.game_map = GameMap(engine, self.width, self.height, entities=[player])
+
+        rooms = self.dig(game_map)
+        start = self.player or rooms[0].center
+        player.place(*start, game_map)
+        if not game_map.tiles["walkable"][start]:
+            # A start in the rock gets a tunnel to the nearest room.
+            centers = np.array([room.center for room in rooms])
+            nearest = rooms[int(np.abs(centers - start).sum(axis=1).argmin())]
+            dig_tunnel(game_map, start, nearest.center)
+
+        if self.layout == "open": # In the corner farthest from the player.
+            stairs = (
+                1 if start[0] > self.width // 2 else self.width - 2,
+                1 if start[1] > self.height // 2 else self.height - 2,
+            )
+        else:
+            stairs = rooms[-1].center
+        game_map.down_stairs_location = stairs
+        game_map.tiles[stairs] = tile_types.down_stairs
+        self.populate(game_map)
+
+        engine.update_fov()
+        engine.message_log.add_message(f"Scenario {self}.", color.welcome_text)
+        equip_starting_gear(player)
+        return engine
+
+    def dig(self, game_map: GameMap) -> List[RectangularRoom]:
+        """Carve the rooms and the tunnels linking them, returning the rooms."""
+        if self.layout == "open":
+            room = RectangularRoom(0, 0, self.width - 1, self.height - 1)
+            game_map.tiles[room.inner] = tile_types.floor
+            return [room]
+
+        # Unlike procgen, overlaps are found in an array of the rooms dug so far, so
+        # placing a room doesn't get slower with the number of rooms.
+        taken = np.zeros((self.width, self.height), dtype=bool)
+        rooms = []
+        for _ in range(self.rooms):
+            room_width = random.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            room_height = random.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+            x = random.randint(0, self.width - room_width - 1)
+            y = random.randint(0, self.height - room_height - 1)
+            room = RectangularRoom(x, y, room_width, room_height)
+            outline = np.s_[room.x1 : room.x2 + 1, room.y1 : room.y2 + 1]
+            if taken[outline].any():
+                continue
+            taken[outline] = True
+            game_map.tiles[room.inner] = tile_types.floor
+            rooms.append(room)
+
+        rooms.sort(key=lambda room: sweep_order(*room.center))
+        for previous, room in zip(rooms, rooms[1:]):
+            dig_tunnel(game_map, previous.center, room.center)
+        return rooms
+
+    def populate(self, game_map: GameMap) -> None:
+        """Spawn the actors, items and corpses on free floor tiles."""
+        free = np.argwhere(game_map.tiles["walkable"])
+        player = game_map.engine.player
+        free = free[(free[:, 0] != player.x) | (free[:, 1] != player.y)]
+        wanted = self.actors + self.items + self.corpses
+        if wanted > len(free):
+            raise ValueError(f"{wanted} entities don't fit in {len(free)} free floor tiles.")
+
+        locations = [(int(x), int(y)) for x, y in free[random.sample(range(len(free)), wanted)]]
+        for x, y in locations[: self.actors]:
+            random.choice(ACTORS).spawn(game_map, x, y)
+        for x, y in locations[self.actors : self.actors + self.items]:
+            random.choice(ITEMS).spawn(game_map, x, y)
+        for x, y in locations[self.actors + self.items :]:
+            random.choice(ACTORS).spawn(game_map, x, y).fighter.leave_remains()
+
+
+def argument(text: str) -> Scenario:
+    """Read a scenario given on the command line, for argparse."""
+    try:
+        return Scenario.parse(text)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def parse_pair(text: str) -> Tuple[int, int]:
+    """Read `WIDTHxHEIGHT` or `XxY`."""
+    first, separator, second = text.strip().partition("x")
+    if not separator:
+        raise ValueError(f"Expected two numbers like 80x43, got {text!r}.")
+    return int(first), int(second)
+
+
+def sweep_order(x: int, y: int) -> Tuple[int, int]:
+    """Sort key going left to right along a band, then right to left along the next one."""
+    band = y // BAND_HEIGHT
+    return band, x if band % 2 == 0 else -x
+
+
+def dig_tunnel(game_map: GameMap, start: Tuple[int, int], end: Tuple[int, int]) -> None:
+    """Dig an L-shaped tunnel like procgen.tunnel_between, a whole segment at a time."""
+    (x1, y1), (x2, y2) = start, end
+    if random.random() < 0.5:
+        corner_x, corner_y = x2, y1 # Move horizontally, then vertically.
+    else:
+        corner_x, corner_y = x1, y2 # Move vertically, then horizontally.
+    for (ax, ay), (bx, by) in (((x1, y1), (corner_x, corner_y)), ((corner_x, corner_y), (x2, y2))):
+        segment = np.s_[min(ax, bx) : max(ax, bx) + 1, min(ay, by) : max(ay, by) + 1]
+        game_map.tiles[segment] = tile_types.floor
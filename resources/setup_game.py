@@ -5,22 +5,54 @@ import copy
 
 import lzma
 import pickle
+import random
+import time
 import traceback
 
-from typing import Optional
+from typing import Dict, Hashable, Optional, TYPE_CHECKING
+import numpy as np
 import tcod
 from tcod import libtcodpy
+from resources import assets
 from resources import color
-from resources.engine import Engine
-from resources import entity_factories
-from resources.game_map import GameWorld
 from resources import input_handlers
+from resources import layers
+from resources import save_file
+from resources import save_slots
 
-# Load the background image and remove the alpha channel.
-background_image = tcod.image.load("src/menu_background.png")[:,:,:3]
+# The modules needed to play are imported when a game starts, so the menu shows up sooner.
+if TYPE_CHECKING:
+    from resources.engine import Engine
+    from resources.entity import Actor
+
+BACKGROUND_IMAGE_FILENAME = "src/menu_background.png"
+background_image: Optional[np.ndarray] = None # Loaded the first time the menu is drawn.
+
+# The main menu doesn't change, it is drawn once into this layer and blitted afterwards.
+menu_layer = layers.CachedLayer("menu")
+
+
+def get_background_image()->np.ndarray:
+    """Return the main menu background, loading it the first time."""
+    global background_image
+    if background_image is None:
+        # Load the background image and remove the alpha channel.
+        background_image = assets.load_image(BACKGROUND_IMAGE_FILENAME)[:,:,:3]
+    return background_image
+
+# Rows of the save minimap shown when choosing a game to continue.
+THUMBNAIL_ROWS = save_slots.THUMBNAIL_HEIGHT
+
+def new_game(seed:Optional[int] = None) ->Engine:
+    """
+    Return a brand new game session as an Engine instance.
+
+    The dungeon is made from `seed`, or from a new one. The engine keeps it for the run history.
+    """
+    from resources.engine import Engine
+    from resources import entity_factories
+    from resources.game_map import GameWorld
 
-def new_game() ->Engine:
-    """Return a brand new game session as an Engine instance."""
     map_width = 80
     map_height = 43
 
@@ -29,9 +61,14 @@ def new_game() ->Engine:
     max_rooms = 30
 
 
+    if seed is None:
+        seed = random.randrange(2**32)
+    random.seed(seed)
+
     player = copy.deepcopy(entity_factories.player)
 
     engine = Engine(player = player)
+    engine.seed = seed
 
     engine.game_world = GameWorld(
         engine = engine,
@@ -50,6 +87,13 @@ def new_game() ->Engine:
         "Hello and welcome, adventurer, to Tato's Roguelike",color.welcome_text
     )
 
+    equip_starting_gear(player)
+    return engine
+
+def equip_starting_gear(player:Actor)->None:
+    """Give the player the dagger and the leather armor every game starts with."""
+    from resources import entity_factories
+
     dagger = copy.deepcopy(entity_factories.dagger)
     leather_armor = copy.deepcopy(entity_factories.leather_armor)
 
@@ -61,12 +105,21 @@ def new_game() ->Engine:
 
     player.inventory.items.append(leather_armor)
     player.equipment.toggle_equip(leather_armor,add_message=False)
-    return engine
 
 def load_game(filename:str)->Engine:
-    """Load an Engine instance from a file."""
+    """
+    Load an Engine instance from a file.
+
+    Only what's needed to play the current floor is decoded, the rest waits until it's used.
+    """
+    from resources.engine import Engine
+
     with open(filename,"rb") as f:
-        engine = pickle.loads(lzma.decompress(f.read()))
+        data = f.read()
+    if save_file.is_sectioned(data):
+        engine = save_file.load_engine(save_file.read(data))
+    else:
+        engine = pickle.loads(lzma.decompress(data))
     assert isinstance(engine,Engine)
     return engine
 
@@ -74,9 +127,30 @@ def load_game(filename:str)->Engine:
 class MainMenu(input_handlers.BaseEventHandler):
     """Handle the main menu rendering and input."""
 
+    def __init__(self)->None:
+        # Games being loaded in the background, by slot. The last saved game starts loading
+        # once the menu is on the screen, so continuing it is usually instant. Started earlier,
+        # the loading would slow down opening the window and drawing the first frame.
+        self.loaders: Dict[int,save_slots.SaveLoader] = {}
+        self.refresh_interval = 0.0 # Wake up right after the first frame, see `update`.
+
+    def update(self)->input_handlers.BaseEventHandler:
+        if self.refresh_interval is not None:
+            self.refresh_interval = None # Only wait for input from now on.
+            slot = save_slots.latest_slot(save_slots.read_index())
+            if slot is not None and slot not in self.loaders:
+                self.loaders[slot] = save_slots.SaveLoader(slot)
+        return self
+
+    def render_key(self)->Optional[Hashable]:
+        return () # The menu never changes.
+
     def on_render(self,console:tcod.Console)->None:
+        menu_layer.composite(console,(),self.render_menu)
+
+    def render_menu(self,console:tcod.Console)->None:
         """Render the main menu on a background image."""
-        console.draw_semigraphics(background_image,0,0)
+        console.draw_semigraphics(get_background_image(),0,0)
 
         console.print(
             console.width//2,
@@ -95,7 +169,7 @@ class MainMenu(input_handlers.BaseEventHandler):
 
         menu_width = 24
         for i, text in enumerate(
-            ["[N] Play a new game","[C] Continue last game","[Q] Quit"]
+            ["[N] Play a new game","[C] Continue a saved game","[Q] Quit"]
         ):
             console.print(
                 console.width //2,
@@ -115,14 +189,188 @@ class MainMenu(input_handlers.BaseEventHandler):
         
         elif event.sym == tcod.event.KeySym.c:
             try:
-                return input_handlers.MainGameEventHandler(load_game("savegame.sav"))
-            except FileNotFoundError:
-                return input_handlers.PopupMessage(self,"No saved game to load.")
+                save_slots.migrate_legacy_save()
             except Exception as exc:
                 traceback.print_exc() # Print to stderr
                 return input_handlers.PopupMessage(self,f"Failed to load save:\n{exc}")
-            
-        
+
+            headers = save_slots.read_index()
+            if not headers:
+                return input_handlers.PopupMessage(self,"No saved game to load.")
+            return LoadGameMenu(self,headers,self.loaders)
         
         elif event.sym == tcod.event.KeySym.n:
-            return input_handlers.MainGameEventHandler(new_game())
\ No newline at end of file
+            if save_slots.free_slot() is None:
+                return ReplaceSlotPrompt(self,save_slots.read_index()[save_slots.oldest_slot()])
+            return start_new_game()
+
+
+def start_new_game(replace_slot:Optional[int] = None)->input_handlers.BaseEventHandler:
+    """Start a new game. It may only take `replace_slot` when every slot is used."""
+    engine = new_game()
+    save_slots.start_session(engine,replace_slot)
+    return engine.handlers.main
+
+
+class ReplaceSlotPrompt(input_handlers.PopupMessage):
+    """
+    Every slot holds a save: ask before a new game replaces the oldest one. Without the
+    player's agreement the new game isn't saved at all.
+    """
+
+    def __init__(self,parent_handler:input_handlers.BaseEventHandler,header:save_slots.SaveHeader):
+        super().__init__(
+            parent_handler,
+            f"Every save slot is used. Replace slot {header.slot} when saving?\n"
+            f"{header.summary}\n[Y] Yes  [N] No",
+        )
+        self.slot = header.slot
+
+    def ev_keydown(
+            self,event:tcod.event.KeyDown
+    )->Optional[input_handlers.BaseEventHandler]:
+        if event.sym == tcod.event.KeySym.y:
+            return start_new_game(self.slot)
+        if event.sym in (tcod.event.KeySym.n,tcod.event.KeySym.ESCAPE):
+            return self.parent
+        return None
+
+
+class LoadGameMenu(input_handlers.BaseEventHandler):
+    """
+    List the save slots and preview the selected one.
+
+    Only the headers from the save index are read here, the game itself is loaded
+    once a slot is chosen.
+    """
+
+    def __init__(
+            self,
+            parent_handler:input_handlers.BaseEventHandler,
+            headers:Dict[int,save_slots.SaveHeader],
+            loaders:Dict[int,save_slots.SaveLoader],
+    ):
+        self.parent = parent_handler
+        self.headers = [headers[slot] for slot in sorted(headers)]
+        self.loaders = loaders
+        self.cursor = 0
+
+    def render_key(self)->Optional[Hashable]:
+        return self.cursor
+
+    def on_render(self,console:tcod.Console)->None:
+        parent_key = self.parent.render_key()
+        layers.background.composite(
+            console,
+            None if parent_key is None else (self.parent,parent_key),
+            self.parent.on_render,
+        )
+
+        width = console.width - 8
+        x = 4
+        y = console.height // 2 - 4
+        height = len(self.headers) + THUMBNAIL_ROWS + 4
+        console.draw_frame(
+            x = x,
+            y = y,
+            width = width,
+            height = height,
+            title = "Continue",
+            clear = True,
+            fg = color.menu_text,
+            bg = color.black,
+        )
+
+        for i, header in enumerate(self.headers):
+            text = f"({chr(ord('a')+i)}) Slot {header.slot}: {header.summary}"
+            if i == self.cursor:
+                console.print(x+1,y+1+i,text[:width-2],fg=color.black,bg=color.menu_text)
+            else:
+                console.print(x+1,y+1+i,text[:width-2],fg=color.menu_text)
+
+        # Preview the minimap of the selected save.
+        thumbnail_y = y + len(self.headers) + 2
+        for i, row in enumerate(self.headers[self.cursor].thumbnail[:THUMBNAIL_ROWS]):
+            console.print(
+                console.width//2,thumbnail_y+i,row,fg=color.menu_text,alignment=libtcodpy.CENTER
+            )
+
+    def ev_keydown(
+            self,event:tcod.event.KeyDown
+    )->Optional[input_handlers.BaseEventHandler]:
+        if event.sym == tcod.event.KeySym.ESCAPE:
+            return self.parent
+        if event.sym == tcod.event.KeySym.UP:
+            self.cursor = (self.cursor - 1) % len(self.headers)
+        elif event.sym == tcod.event.KeySym.DOWN:
+            self.cursor = (self.cursor + 1) % len(self.headers)
+        elif event.sym in input_handlers.CONFIRM_KEYS:
+            return self.load(self.headers[self.cursor].slot)
+        else:
+            index = event.sym - tcod.event.KeySym.a
+            if 0 <= index < len(self.headers):
+                return self.load(self.headers[index].slot)
+        return None
+
+    def load(self,slot:int)->input_handlers.BaseEventHandler:
+        """Continue the game saved in `slot`, waiting for it to load if it isn't yet."""
+        loader = self.loaders.get(slot)
+        if loader is None or loader.error is not None: # Not loading yet, or try again.
+            loader = self.loaders[slot] = save_slots.SaveLoader(slot)
+        return LoadingScreen(self.parent,loader).update()
+
+
+class LoadingScreen(input_handlers.BaseEventHandler):
+    """Show a spinner over the menu until the game being loaded is ready."""
+
+    refresh_interval = 0.1
+    SPINNER = "|/-\\"
+
+    def __init__(
+            self,parent_handler:input_handlers.BaseEventHandler,loader:save_slots.SaveLoader
+    ):
+        self.parent = parent_handler
+        self.loader = loader
+        self.start_time = time.perf_counter()
+
+    def update(self)->input_handlers.BaseEventHandler:
+        if not self.loader.done:
+            return self
+        if isinstance(self.loader.error,FileNotFoundError):
+            save_slots.delete_slot(self.loader.slot) # The index was out of date.
+            return input_handlers.PopupMessage(self.parent,"No saved game to load.")
+        if self.loader.engine is None:
+            return input_handlers.PopupMessage(
+                self.parent,f"Failed to load save:\n{self.loader.error}"
+            )
+        return self.loader.engine.handlers.main
+
+    def render_key(self)->Optional[Hashable]:
+        # A new key for every step of the spinner.
+        return int((time.perf_counter() - self.start_time) / self.refresh_interval)
+
+    def on_render(self,console:tcod.Console)->None:
+        parent_key = self.parent.render_key()
+        layers.background.composite(
+            console,
+            None if parent_key is None else (self.parent,parent_key),
+            self.parent.on_render,
+        )
+
+        spinner = self.SPINNER[self.render_key() % len(self.SPINNER)]
+        text = f"Loading slot {self.loader.slot} {spinner}"
+        width = len(text) + 4
+        x = (console.width - width) // 2
+        y = console.height // 2 - 1
+        console.draw_frame(
+            x = x, y = y, width = width, height = 3, clear = True,
+            fg = color.menu_text, bg = color.black,
+        )
+        console.print(x+2,y+1,text,fg=color.menu_text)
+
+    def ev_keydown(
+            self,event:tcod.event.KeyDown
+    )->Optional[input_handlers.BaseEventHandler]:
+        if event.sym == tcod.event.KeySym.ESCAPE:
+            return self.parent # The game keeps loading, choosing it again picks it up.
+        return None
@@ -0,0 +1,327 @@
+"""Fast copies of a whole game session, used for look-ahead search and what-if runs."""
+from __future__ import annotations
+
+import enum
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from components.base_component import BaseComponent
+from resources.actions import Action
+from resources.engine import Engine
+from resources.entity import Entity
+from resources.game_map import GameMap, GameWorld
+from resources.message_log import Message, MessageLog
+
+# Objects of these types are cloned one by one, every other attribute value is shared.
+# Everything they hold is either one of them, a numpy array, a list or set of them
+# or an immutable value (ints, strings, color tuples...).
+GRAPH_TYPES = (BaseComponent, Action, Engine, Entity, GameMap, GameWorld, MessageLog)
+
+# Attribute types that can be shared without looking at them any further.
+PLAIN_TYPES = {int, float, bool, str, tuple, type(None)}
+# Other types whose values are shared: enums, classes and functions.
+SHARED_TYPES = (enum.Enum, type, types.FunctionType)
+
+
+class Layout:
+    """
+    The attributes of a class which have to be looked at one by one when it's copied.
+
+    `references` are the attributes which held objects of the snapshot, or None, in the
+    objects of the class seen so far. `structural` are the ones which held arrays, lists or
+    sets, and the ones which were always None. Every other attribute holds an immutable value,
+    shared along with the rest of the object's __dict__ in a single dict copy.
+    An attribute is expected to keep holding the same kind of value.
+    """
+
+    def __init__(self, state: Dict[str, Any], previous: Optional[Layout] = None):
+        names = set(state)
+        objects = set()
+        containers = set()
+        optional = set()
+        if previous is not None:
+            names |= previous.names
+            objects |= previous.objects
+            containers |= previous.containers
+            optional |= previous.optional
+        for name, value in state.items():
+            if value is None:
+                optional.add(name)
+            elif isinstance(value, GRAPH_TYPES):
+                objects.add(name)
+            elif not (type(value) in PLAIN_TYPES or isinstance(value, SHARED_TYPES)):
+                containers.add(name)
+        self.names = frozenset(names)
+        self.objects = frozenset(objects)
+        self.containers = frozenset(containers)
+        self.optional = frozenset(optional)
+        self.references = tuple(sorted(objects - containers))
+        self.structural = tuple(sorted(containers | optional - objects))
+
+
+# The layout of every class copied so far. It's only made again when an object of the class
+# has an attribute the layout doesn't know about.
+layouts: Dict[type, Layout] = {}
+
+
+def layout_of(obj: Any) -> Layout:
+    layout = layouts.get(type(obj))
+    if layout is None or not obj.__dict__.keys() <= layout.names:
+        layout = layouts[type(obj)] = Layout(obj.__dict__, layout)
+    return layout
+
+
+# A flat record of one object's __dict__, split by how each attribute is rebuilt.
+Record = Tuple[
+    Dict[str, Any],  # Values shared as they are.
+    Tuple[Tuple[str, int], ...],  # References to other objects of the snapshot, by index.
+    Tuple[Tuple[str, np.ndarray], ...],  # numpy arrays, copied on every restore.
+    Tuple[Tuple[str, type, Tuple[Tuple[bool, Any], ...]], ...],  # Lists and sets of both.
+]
+
+
+def previous_record(previous: Optional[EngineSnapshot], i: int, cls: type) -> Optional[Record]:
+    """Return the record `i` of the previous snapshot, if it's a record of the same class."""
+    if previous is None or i >= len(previous.records) or previous.classes[i] is not cls:
+        return None
+    return previous.records[i]
+
+
+def same_array(array: np.ndarray, old_array: np.ndarray) -> bool:
+    """Return True if both arrays hold the same values, comparing their memory when possible."""
+    if array.shape != old_array.shape or array.dtype != old_array.dtype:
+        return False
+    layout = array.flags.c_contiguous, array.flags.f_contiguous
+    if layout != (old_array.flags.c_contiguous, old_array.flags.f_contiguous) or not any(layout):
+        return bool(np.array_equal(array, old_array))
+    # Comparing the bytes is much faster than comparing structured values (like the tiles).
+    return bool(np.array_equal(
+        array.ravel(order="K").view(np.uint8), old_array.ravel(order="K").view(np.uint8)
+    ))
+
+
+def share(record: Record, old_record: Record) -> Record:
+    """Return the previous snapshot's record if it's unchanged, otherwise reuse what it can."""
+    values, references, arrays, containers = record
+    old_values, old_references, old_arrays, old_containers = old_record
+
+    if values == old_values:
+        values = old_values
+    if containers == old_containers:
+        containers = old_containers
+
+    if (
+        values is old_values
+        and containers is old_containers
+        and references == old_references
+        and len(arrays) == len(old_arrays)
+        and all(a is b for (_, a), (_, b) in zip(arrays, old_arrays))
+    ):
+        return old_record
+    return values, references, arrays, containers
+
+
+class EngineSnapshot:
+    """
+    A frozen copy of an Engine.
+
+    The engine, its maps, entities and components are stored as a flat table of records,
+    so restoring only has to create the objects and wire the references back together,
+    which is much faster than `copy.deepcopy` or a pickle round-trip.
+    A snapshot is never modified, it can be restored as many times as needed.
+
+    When a `previous` snapshot of the same session is given, records and arrays which didn't
+    change since then are shared with it instead of being stored again.
+    Attributes listed in the Engine's `TRANSIENT` tuple belong to the running session and are
+    left out.
+    """
+
+    def __init__(self, engine: Engine, previous: Optional[EngineSnapshot] = None):
+        self.classes: List[type] = []
+        self.records: List[Record] = []
+        transient = set(engine.TRANSIENT)
+
+        objects: List[Any] = [engine]
+        index = {id(engine): 0}
+
+        def reference(obj: Any) -> Optional[int]:
+            """Return the index of `obj`, queueing it if it's part of the snapshot."""
+            i = index.get(id(obj))
+            if i is None and isinstance(obj, GRAPH_TYPES):
+                i = index[id(obj)] = len(objects)
+                objects.append(obj)
+            return i
+
+        for obj in objects:  # `objects` grows while we walk it.
+            values = obj.__dict__.copy()
+            if obj is engine:
+                for name in transient:
+                    values.pop(name, None)
+            references: List[Tuple[str, int]] = []
+            arrays: List[Tuple[str, np.ndarray]] = []
+            containers: List[Tuple[str, type, Tuple[Tuple[bool, Any], ...]]] = []
+
+            layout = layout_of(obj)
+            for name in layout.references:
+                value = values.get(name)
+                i = index.get(id(value))
+                if i is None:
+                    i = reference(value)
+                    if i is None:
+                        continue  # None, or a value shared like the plain ones.
+                references.append((name, i))
+                del values[name]
+
+            for name in layout.structural:
+                value = values.get(name)
+                kind = type(value)
+                if kind is list or kind is set:
+                    if type(obj) is MessageLog and name == "recent" and value:
+                        # Only the last message can still change (its count), the older
+                        # ones are shared.
+                        items = [(False, message) for message in value]
+                        items[-1] = (True, len(objects))
+                        index[id(value[-1])] = len(objects)
+                        objects.append(value[-1])
+                    else:
+                        items = []
+                        for item in value:
+                            i = reference(item)
+                            items.append((False, item) if i is None else (True, i))
+                    containers.append((name, kind, tuple(items)))
+                elif kind is np.ndarray:
+                    # Unchanged arrays are kept once: a turn usually leaves the tiles and most
+                    # of the explored area alone. They are compared before being copied, so
+                    # an unchanged array costs no copy.
+                    old_record = previous_record(previous, len(self.records), type(obj))
+                    old_array = None if old_record is None else dict(old_record[2]).get(name)
+                    if old_array is not None and same_array(value, old_array):
+                        arrays.append((name, old_array))
+                    else:
+                        arrays.append((name, value.copy(order="K")))
+                else:
+                    i = reference(value)
+                    if i is None:
+                        continue
+                    references.append((name, i))
+                del values[name]
+
+            record: Record = (values, tuple(references), tuple(arrays), tuple(containers))
+            old_record = previous_record(previous, len(self.records), type(obj))
+            if old_record is not None:
+                record = share(record, old_record)
+            self.classes.append(type(obj))
+            self.records.append(record)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def restore(self, engine: Optional[Engine] = None) -> Engine:
+        """
+        Rebuild the saved session and return its Engine.
+
+        If `engine` is given its state is replaced in place, so handlers holding it keep working.
+        Otherwise a brand new, detached Engine is returned (see `detach`).
+        """
+        objects: List[Any] = [cls.__new__(cls) for cls in self.classes]
+        if engine is not None:
+            objects[0] = engine
+            kept = {
+                name: engine.__dict__[name]
+                for name in engine.TRANSIENT
+                if name in engine.__dict__
+            }
+            engine.__dict__.clear()
+            engine.__dict__.update(kept)
+
+        for obj, (values, references, arrays, containers) in zip(objects, self.records):
+            state = obj.__dict__
+            state.update(values)
+            for name, i in references:
+                state[name] = objects[i]
+            if arrays:
+                for name, array in arrays:
+                    state[name] = array.copy(order="K")
+            if containers:
+                for name, container_type, items in containers:
+                    state[name] = container_type(
+                        [objects[item] if is_ref else item for is_ref, item in items]
+                    )
+        if engine is None:
+            detach(objects[0])
+        return objects[0]
+
+
+def detach(engine: Engine) -> None:
+    """
+    Cut a copy of a session off from the original's files and from the game's records: it
+    has no save slot and is never saved, doesn't write in the original's spill file, and its
+    turns and deaths don't reach the metrics, profiles, telemetry nor the run history.
+    """
+    engine.simulated = True
+    engine.savable = False
+    engine.save_slot = None
+    engine.message_log.spill_filename = None
+
+
+def clone(engine: Engine) -> Engine:
+    """
+    Return an independent, detached copy of `engine`, made in a single walk over its objects.
+
+    This is what restoring a snapshot right away would give, without making the records in
+    between. Like in snapshots, the immutable values and the older messages are shared.
+    """
+    originals: List[Any] = [engine]
+    copies = {id(engine): object.__new__(Engine)}
+
+    def copy_of(obj: Any) -> Any:
+        """Return the copy of `obj`, queueing it if it wasn't seen yet. `obj` if it's shared."""
+        copy = copies.get(id(obj))
+        if copy is None:
+            if not isinstance(obj, GRAPH_TYPES):
+                return obj
+            copy = copies[id(obj)] = object.__new__(type(obj))
+            originals.append(obj)
+        return copy
+
+    for obj in originals:  # `originals` grows while we walk it.
+        state = obj.__dict__.copy()
+        if obj is engine:
+            for name in engine.TRANSIENT:
+                state.pop(name, None)
+
+        layout = layouts.get(type(obj))
+        if layout is None or not state.keys() <= layout.names:
+            layout = layout_of(obj)
+        for name in layout.references:
+            value = state.get(name)
+            value_copy = copies.get(id(value))
+            if value_copy is None:
+                if not isinstance(value, GRAPH_TYPES):
+                    continue  # None, or a value shared like the plain ones.
+                value_copy = copies[id(value)] = object.__new__(type(value))
+                originals.append(value)
+            state[name] = value_copy
+
+        for name in layout.structural:
+            value = state.get(name)
+            kind = type(value)
+            if kind is list or kind is set:
+                if type(obj) is MessageLog and name == "recent" and value:
+                    # Only the last message can still change (its count), older ones are shared.
+                    items = list(value)
+                    last = items[-1] = object.__new__(Message)
+                    last.__dict__.update(value[-1].__dict__)
+                    state[name] = items
+                else:
+                    state[name] = kind([copy_of(item) for item in value])
+            elif kind is np.ndarray:
+                state[name] = value.copy(order="K")
+            elif value is not None:
+                state[name] = copy_of(value)
+        copies[id(obj)].__dict__ = state
+    engine_copy = copies[id(engine)]
+    detach(engine_copy)
+    return engine_copy
@@ -0,0 +1,120 @@
+"""
+Measure where the time goes between launching the game and presenting its first frame.
+
+`python main.py --startup-report` prints how long each module took to import, how long each
+asset took to decode and when each step of the startup ended, counting from the launch.
+Nothing is measured without the flag.
+"""
+from __future__ import annotations
+
+import contextlib
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+REPORT_FLAG = "--startup-report"
+
+enabled = False
+launch_time = 0.0
+phases: List[Tuple[str, float]] = [] # Step name and when it ended, since the launch.
+assets: List[Tuple[str, float]] = [] # Asset name and how long it took to load.
+# Module name -> (time spent in the module itself, time including the modules it imported).
+import_times: Dict[str, Tuple[float, float]] = {}
+# For each module being imported, the time spent importing the modules it imports.
+import_stack: List[float] = []
+import_total = 0.0 # Time spent importing, nested imports are only counted once.
+
+
+# A meta path finder only needs find_spec. It doesn't derive from importlib.abc.MetaPathFinder,
+# importlib.abc alone would add tens of milliseconds to every launch.
+class ImportTimer:
+    """Finds modules like the finders after it, and times the execution of each of them."""
+
+    def find_spec(self, fullname: str, path: Any, target: Any = None) -> Any:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        loader = spec.loader
+        # Built in and frozen modules are loaded by classes shared by all of them, leave those.
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module: Any) -> None:
+            import_stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                global import_total
+                total = time.perf_counter() - start
+                children = import_stack.pop()
+                if import_stack:
+                    import_stack[-1] += total
+                else:
+                    import_total += total
+                import_times[fullname] = (total - children, total)
+
+        try:
+            loader.exec_module = timed_exec_module
+        except AttributeError:
+            pass # A loader which can't be patched, its module isn't timed.
+        return spec
+
+
+def enable(launched_at: float) -> None:
+    """Start measuring. `launched_at` is the time.perf_counter() of the launch."""
+    global enabled, launch_time
+    enabled = True
+    launch_time = launched_at
+    sys.meta_path.insert(0, ImportTimer())
+
+
+def mark(phase: str) -> None:
+    """Record that a step of the startup just ended."""
+    if enabled:
+        phases.append((phase, time.perf_counter() - launch_time))
+
+
+@contextlib.contextmanager
+def timed_asset(name: str) -> Iterator[None]:
+    """Record how long loading the asset `name` takes."""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        assets.append((name, time.perf_counter() - start))
+
+
+def report(top: int = 15) -> Optional[str]:
+    """Return the measures so far, or None if they weren't enabled."""
+    if not enabled:
+        return None
+    lines = ["Startup report (milliseconds)", "Steps, since the launch:"]
+    lines += [f"  {ms(at):>9} {phase}" for phase, at in phases]
+
+    lines.append("Assets:")
+    lines += [f"  {ms(duration):>9} {name}" for name, duration in assets]
+
+    lines.append(
+        f"Imports: {len(import_times)} modules in {ms(import_total)}. "
+        f"Slowest by their own time (self / total):"
+    )
+    slowest = sorted(import_times.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    lines += [
+        f"  {ms(own):>9} / {ms(total):>9} {name}" for name, (own, total) in slowest
+    ]
+    return "\n".join(lines)
+
+
+def ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f}"
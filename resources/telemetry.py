@@ -0,0 +1,137 @@
+"""
+Telemetry of the game events worth analysing: damage dealt, deaths, pickups, level ups and
+floor changes.
+
+Recording an event only appends a tuple to an in-memory buffer. A background thread turns
+the buffer into JSON lines and writes them every FLUSH_INTERVAL seconds, or sooner when
+FLUSH_RECORDS events are waiting, so the turns never wait for the disk. Once the file grows
+over `max_bytes` it is rotated like logging's RotatingFileHandler does: telemetry.jsonl is
+renamed to telemetry.jsonl.1, the previous .1 to .2 and so on, up to `backups` files.
+
+    python main.py --telemetry telemetry.jsonl
+    python -m resources.headless --telemetry telemetry.jsonl
+
+Nothing is recorded until a file is opened.
+"""
+from __future__ import annotations
+
+import collections
+import json
+import os
+import threading
+import time
+from typing import Any, BinaryIO, Deque, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from resources.engine import Engine
+
+FLUSH_INTERVAL = 1.0 # Seconds between two writes.
+FLUSH_RECORDS = 512 # Events waiting that wake the writer before its interval.
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+# When, the turn, the floor, the event, and its fields.
+Record = Tuple[float, int, int, str, dict]
+
+
+class Telemetry:
+    """The buffer of events, and the thread writing it to a rotated file."""
+
+    def __init__(self) -> None:
+        # Deques can be appended to and popped from different threads without a lock.
+        self.buffer: Deque[Record] = collections.deque()
+        self.filename: Optional[str] = None
+        self.file: Optional[BinaryIO] = None
+        self.size = 0
+        self.max_bytes = DEFAULT_MAX_BYTES
+        self.backups = DEFAULT_BACKUPS
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def open(
+            self,
+            filename: str,
+            max_bytes: int = DEFAULT_MAX_BYTES,
+            backups: int = DEFAULT_BACKUPS,
+    ) -> None:
+        """Start recording the events, appending them to `filename`."""
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(filename, "ab")
+        self.size = self.file.tell()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def record(self, engine: Engine, event: str, **fields: Any) -> None:
+        """Record that `event` happened now in `engine`, with the given fields."""
+        if self.thread is None or engine.simulated:
+            return
+        self.buffer.append(
+            (time.time(), engine.turn, engine.game_world.current_floor, event, fields)
+        )
+        if len(self.buffer) >= FLUSH_RECORDS:
+            self.wake.set()
+
+    def run(self) -> None:
+        while True:
+            self.wake.wait(FLUSH_INTERVAL)
+            self.wake.clear()
+            stopping = self.stopping.is_set()
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self) -> None:
+        """Write the events buffered so far. Only the writer thread calls this while it runs."""
+        while self.buffer:
+            # In batches, so a file never grows much over `max_bytes` before it is rotated.
+            lines = []
+            while self.buffer and len(lines) < FLUSH_RECORDS:
+                timestamp, turn, floor, event, fields = self.buffer.popleft()
+                lines.append(json.dumps(
+                    {"time": timestamp, "turn": turn, "floor": floor, "event": event, **fields}
+                ))
+            self.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def write(self, data: bytes) -> None:
+        # Written as bytes, so `size` counts what is on disk, whatever the text and the platform.
+        if self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        assert self.file is not None
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self) -> None:
+        assert self.file is not None and self.filename is not None
+        self.file.close()
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.filename}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.filename}.{number + 1}")
+        if self.backups:
+            os.replace(self.filename, f"{self.filename}.1")
+        self.file = open(self.filename, "wb")
+        self.size = 0
+
+    def close(self) -> None:
+        """Write what is left in the buffer and stop the writer."""
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.wake.set()
+        self.thread.join()
+        self.thread = None
+        assert self.file is not None
+        self.file.close()
+        self.file = None
+
+
+telemetry = Telemetry()